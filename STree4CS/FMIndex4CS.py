@@ -0,0 +1,440 @@
+'''
+Compressed alternative to the suffix tree of STree4CS: FM-index (Ferragina and Manzini, "Opportunistic data structures
+with applications", 2000) of the concatenated sequences, i.e. the Burrows-Wheeler transform of the text stored in a
+wavelet matrix (Claude and Navarro, "The wavelet matrix", 2012) of rank-indexed bitvectors, and a sampled suffix array.
+The text itself is not kept: the index costs about log2(k+1) bits per symbol for k distinct symbols, plus the
+sampled suffix array, and can be memory-mapped with STree4CS.load so that it does not need to fit in memory.
+
+The index is built on the reversed text, so that the backward search extends the queries to the right, one symbol
+at a time, which is what the greedy coverings need. Building it needs the text and its suffix array in memory.
+'''
+import numpy as np
+
+from .STree4CS import STree4CS
+from .SArray4CS import _suffix_array
+
+SAMPLE_RATE = 32  # one suffix array value out of SAMPLE_RATE is kept
+
+
+def _bitvector(bits):
+    '''
+    :param bits: 1D NumPy array of 0/1 of length n
+    :return: (words, blocks), the bits packed into 64 bits words (bit i being bit i%64 of word i//64, with a padding
+    word) and the number of ones before each block of 4 words, from which rank1 is computed (see _rank1)
+    '''
+    n = len(bits)
+    nw = n // 64 + 1
+    padded = np.zeros(nw * 64, dtype=np.uint8)
+    padded[:n] = bits
+    words = np.packbits(padded, bitorder='little').view('<u8')
+    ones = np.add.reduceat(padded.reshape(nw, 64).sum(axis=1, dtype=np.int64), np.arange(0, nw, 4))
+    blocks = np.zeros(len(ones) + 1, dtype=np.uint32 if n < 2 ** 32 else np.int64)
+    np.cumsum(ones, out=blocks[1:])
+    return words, blocks
+
+
+# number of ones of an integer (int.bit_count from Python 3.10 on)
+_popcount = getattr(int, 'bit_count', None) or (lambda x: bin(x).count('1'))
+
+
+def _rank1(words, blocks, base, bbase, i):
+    """Returns the number of ones before position i in the bitvector whose first word is words[base] and first
+    block count blocks[bbase]."""
+    w = i >> 6
+    b = w >> 2
+    r = blocks[bbase + b]
+    for j in range(base + (b << 2), base + w):
+        r += _popcount(words[j])
+    return r + _popcount(words[base + w] & ((1 << (i & 63)) - 1))
+
+
+class FMIndex4CS(STree4CS):
+    """Class representing the FM-index of a set of sequences, answering the same queries as STree4CS."""
+
+    _backend = 'fm'
+
+    def __new__(cls, *args, **kwargs):
+        return object.__new__(cls)
+
+    def __init__(self, input='', nodeStore=False, backend='fm', bulk=False, sampleRate=SAMPLE_RATE):
+        '''
+        :param input: List of Sequences
+        :param nodeStore: ignored, there are no nodes in this index
+        :param backend: ignored, kept for compatibility with the STree4CS constructor
+        :param bulk: ignored, the index is always built in bulk
+        :param sampleRate: one suffix array value out of sampleRate is kept, the others being recovered by walking
+        the text backwards (at most sampleRate steps per occurrence located)
+        '''
+        self.begs = []
+        self.ends = []
+        self.word_starts = []
+        self.word = np.zeros(0, dtype=np.intc)  # the text is not kept
+        self.codebook = []
+        self._codes = None
+        self.removed = set()
+        self.sampleRate = sampleRate
+        self.size = 0  # length of the text
+        self.levels = 1  # number of bits of the symbols of the wavelet matrix
+        if isinstance(input, np.ndarray) or not input == '':
+            self.build(input)
+
+    def build(self, xs):
+        """Builds the FM-index of the given list of sequences."""
+        if self._check_input(xs) != 'gst':
+            raise ValueError("Sequence argument should be a list of sequences")
+        self._build_generalized(xs)
+
+    def _build_generalized(self, xs):
+        self._build(self._concatenate(xs))
+
+    def _build(self, x):
+        '''
+        Builds the wavelet matrix of the BWT of the reversed text x, each terminal symbol being stored as 0 and each
+        code c as c+1, and the sampled suffix array: the positions multiple of sampleRate, and those following a
+        terminal symbol, from which the text cannot be walked backwards.
+        '''
+        text = np.ascontiguousarray(np.asarray(x, dtype=np.intc)[::-1])
+        n = len(text)
+        k = len(self.codebook)
+        self.size = n
+        self.word = np.zeros(0, dtype=np.intc)
+        sa = _suffix_array(text)
+        values = np.where(text < 0, 0, text.astype(np.int64) + 1)
+        bwt = values[sa - 1] if n else values  # sa - 1 = -1 wraps around to the last symbol
+        b = max(1, k.bit_length())
+        self.levels = b
+
+        words = []
+        blocks = []
+        zeros = np.zeros(b, dtype=np.int64)
+        v = bwt
+        for l in range(b):
+            bits = ((v >> (b - 1 - l)) & 1).astype(np.uint8)
+            w, bl = _bitvector(bits)
+            words.append(w)
+            blocks.append(bl)
+            zeros[l] = n - int(bits.sum())
+            v = np.concatenate([v[bits == 0], v[bits == 1]])  # stable partition of the next level
+        self.fm_words = np.concatenate(words)
+        self.fm_blocks = np.concatenate(blocks)
+        self.fm_zeros = zeros
+
+        # offset of each symbol value, such that LF(i) = fm_offset[v] + (position of i after the last level)
+        counts = np.bincount(bwt, minlength=k + 1)
+        C = np.zeros(k + 2, dtype=np.int64)
+        np.cumsum(counts, out=C[1:])
+        self.fm_offset = C[:k + 1].copy()
+        self._views()
+        for c in range(k + 1):
+            self.fm_offset[c] -= self._final(c, 0)
+
+        marked = ((sa % self.sampleRate) == 0) | (bwt == 0)
+        self.fm_marks, self.fm_mark_blocks = _bitvector(marked.astype(np.uint8))
+        self.fm_samples = sa[marked].astype(np.uint32 if n < 2 ** 32 else np.int64)
+        self._views()
+
+    def _views(self):
+        """Helper method that caches the memoryviews of the arrays, for fast element accesses."""
+        self._words = memoryview(self.fm_words)
+        self._blocks = memoryview(self.fm_blocks)
+        self._zeros = self.fm_zeros.tolist()
+        self._offset = memoryview(self.fm_offset)
+        self._nw = len(self.fm_words) // self.levels
+        self._nb = len(self.fm_blocks) // self.levels
+        if hasattr(self, 'fm_marks'):
+            self._marks = memoryview(self.fm_marks)
+            self._markBlocks = memoryview(self.fm_mark_blocks)
+            self._samples = memoryview(self.fm_samples)
+
+    def __getstate__(self):
+        # the memoryviews cannot be pickled, they are rebuilt by __setstate__
+        return {k: v for k, v in super().__getstate__().items() if not isinstance(v, memoryview)}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._views()
+
+    def _index_arrays(self):
+        return {'fm_words': self.fm_words, 'fm_blocks': self.fm_blocks, 'fm_zeros': self.fm_zeros,
+                'fm_offset': self.fm_offset, 'fm_marks': self.fm_marks, 'fm_mark_blocks': self.fm_mark_blocks,
+                'fm_samples': self.fm_samples,
+                'fm_header': np.array([self.size, self.levels, self.sampleRate], dtype=np.int64)}
+
+    def _load_index_arrays(self, get, word):
+        for name in ('fm_words', 'fm_blocks', 'fm_zeros', 'fm_offset', 'fm_marks', 'fm_mark_blocks', 'fm_samples'):
+            setattr(self, name, get(name))
+        self.size, self.levels, self.sampleRate = get('fm_header').tolist()
+        self._views()
+
+    def nbytes(self):
+        """Returns the size of the index, in bytes (the arrays of the FM-index, not the sequence boundaries)."""
+        return sum(a.nbytes for a in self._index_arrays().values())
+
+    def add_sequence(self, x):
+        raise NotImplementedError("The FM-index cannot be updated, build a new FMIndex4CS")
+
+    def remove_sequence(self, i):
+        raise NotImplementedError("The FM-index cannot be updated, build a new FMIndex4CS")
+
+    def enable_cache(self, maxsize=4096):
+        raise NotImplementedError("The FM-index has no locus cache")
+
+    def _final(self, v, i):
+        """Helper method that returns the position reached by position i after the last level of the wavelet
+        matrix, along the bits of the symbol value v."""
+        words, blocks, zeros, b = self._words, self._blocks, self._zeros, self.levels
+        for l in range(b):
+            r = _rank1(words, blocks, l * self._nw, l * self._nb, i)
+            if (v >> (b - 1 - l)) & 1:
+                i = zeros[l] + r
+            else:
+                i -= r
+        return i
+
+    def _extend(self, lo, hi, c):
+        '''
+        Backward search step: restricts the rows [lo, hi) of the suffixes of the reversed text starting with the
+        reversal of a segment to those of the segment extended with the code c.
+
+        :return: the new rows (lo, hi), empty if the extended segment does not occur
+        '''
+        if c < 0 or c >= len(self._offset) - 1:
+            return 0, 0
+        v = c + 1
+        words, blocks, zeros, b, nb, nw = self._words, self._blocks, self._zeros, self.levels, self._nb, self._nw
+        for l in range(b):
+            rlo = _rank1(words, blocks, l * nw, l * nb, lo)
+            rhi = _rank1(words, blocks, l * nw, l * nb, hi)
+            if (v >> (b - 1 - l)) & 1:
+                lo = zeros[l] + rlo
+                hi = zeros[l] + rhi
+            else:
+                lo -= rlo
+                hi -= rhi
+            if lo >= hi:
+                return 0, 0
+        return self._offset[v] + lo, self._offset[v] + hi
+
+    def _lf(self, i):
+        """Helper method that returns (v, LF(i)), v being the symbol value of the BWT at row i and LF(i) the row of
+        the suffix starting one position before."""
+        words, blocks, zeros, b, nb, nw = self._words, self._blocks, self._zeros, self.levels, self._nb, self._nw
+        v = 0
+        for l in range(b):
+            base = l * nw
+            bit = (words[base + (i >> 6)] >> (i & 63)) & 1
+            r = _rank1(words, blocks, base, l * nb, i)
+            v = (v << 1) | bit
+            i = zeros[l] + r if bit else i - r
+        return v, self._offset[v] + i
+
+    def _position(self, i):
+        """Helper method that returns the position in the reversed text of the suffix of row i."""
+        steps = 0
+        marks = self._marks
+        while not (marks[i >> 6] >> (i & 63)) & 1:
+            i = self._lf(i)[1]
+            steps += 1
+        return self._samples[_rank1(marks, self._markBlocks, 0, 0, i)] + steps
+
+    def _positions(self, lo, hi, m):
+        """Helper method that returns the starting positions in the text of the occurrences of a segment of length m
+        whose rows are [lo, hi)."""
+        return [self.size - self._position(i) - m for i in range(lo, hi)]
+
+    def _interval(self, y, start=0, stop=None):
+        '''
+        :return: (lo, hi, d) where [lo, hi) are the rows of the occurrences of y[start:start+d], d being the length
+        of the longest prefix of y[start:stop] found in the index.
+        '''
+        if stop is None:
+            stop = len(y)
+        lo, hi = 0, self.size
+        d = 0
+        while start + d < stop:
+            a, b = self._extend(lo, hi, y[start + d])
+            if a >= b:
+                break
+            lo, hi = a, b
+            d += 1
+        return lo, hi, d
+
+    def find(self, y, start=0, stop=None):
+        """Returns starting position of the subsequence y[start:stop] in the (virtual) concatenation of the
+        sequences.
+
+        :param y: Seq
+        :param start: Optional: starting index of the subsequence in y
+        :param stop: Optional: ending index (excluded) of the subsequence in y, len(y) by default
+        :return: Index of the starting position of sequence y, -1 if y is not a subsequence.
+        """
+        y = self._encode(y)
+        stop = len(y) if stop is None else min(stop, len(y))
+        if stop <= start:
+            return 0
+        lo, hi, d = self._interval(y, start, stop)
+        if d < stop - start:
+            return -1
+        return self.size - self._position(lo) - d
+
+    def find_all(self, y, start=0, stop=None):
+        y = self._encode(y)
+        stop = len(y) if stop is None else min(stop, len(y))
+        if stop <= start:
+            return list(range(self.size))
+        lo, hi, d = self._interval(y, start, stop)
+        if d < stop - start:
+            return []
+        return self._positions(lo, hi, d)
+
+    def count(self, y):
+        """Returns the number of occurrences of y, the number of rows of its backward search."""
+        y = self._encode(y)
+        lo, hi, d = self._interval(y)
+        return hi - lo if d == len(y) else 0
+
+    def doc_freq(self, y):
+        """Returns the number of distinct sequences in which y occurs."""
+        y = self._encode(y)
+        lo, hi, d = self._interval(y)
+        return len(self._ids(lo, hi, d)) if d == len(y) else 0
+
+    def occurrences(self, y):
+        """Generator of the (sequence index, offset in the sequence) pairs of the occurrences of y (see getSeqId)."""
+        y = self._encode(y)
+        lo, hi, d = self._interval(y)
+        if d < len(y):
+            return
+        if d == 0:
+            for p in range(self.size):
+                yield self.getSeqId(p)
+            return
+        for i in range(lo, hi):
+            yield self.getSeqId(self.size - self._position(i) - d)
+
+    def _ids(self, lo, hi, d):
+        """Helper method that returns the set of the indexes of the sequences of the occurrences of the rows
+        [lo, hi) of a segment of length d."""
+        if d == 0:
+            return set(range(len(self.begs)))
+        positions = np.asarray(self._positions(lo, hi, d), dtype=np.int64)
+        return set((np.searchsorted(np.asarray(self.word_starts), positions, side='right') - 1).tolist())
+
+    def _breaks(self, s, beg, mask):
+        """Helper generator of the (d, bits) pairs of STree4CS.evaluatePerSequence, the sequences of the rows of a
+        segment being found by locating them."""
+        L = len(s)
+        lo, hi, d = 0, self.size, 0
+        while mask:
+            if beg + d == L:
+                yield d, mask
+                return
+            lo, hi = self._extend(lo, hi, s[beg + d])
+            inside = 0
+            if lo < hi:
+                inside = self._mask(self._ids(lo, hi, d + 1)) & mask
+            if mask & ~inside:
+                yield d, mask & ~inside
+            mask = inside
+            d += 1
+
+    def _matchFreq(self, s, beg):
+        lo, hi, d = self._interval(self._encode(s), beg)
+        return d, len(self._ids(lo, hi, d))
+
+    def _match_start(self):
+        return (0, self.size, 0)
+
+    def _match_step(self, state, c):
+        """Helper method that extends the rows (lo, hi, d) of a segment of length d to the segment extended with the
+        symbol c, None if it is not found."""
+        lo, hi, d = state
+        lo, hi = self._extend(lo, hi, self._code(c))
+        if lo >= hi:
+            return None
+        return (lo, hi, d + 1)
+
+    def matchingStatistics(self, s, seqIdxs=None):
+        '''
+        :param s: a sequence
+        :param seqIdxs: Optional: List of indexes of sequences. If provided, only the subsequences common to all these
+        sequences are matched.
+        :return: the list ms of the matching statistics of s, ms[i] being the length of the longest prefix of s[i:]
+        found in the index.
+        '''
+        s = self._encode(s)
+        if seqIdxs is None:
+            return [self._interval(s, i)[2] for i in range(len(s))]
+        seqIdxs = set(seqIdxs)
+        ms = []
+        for i in range(len(s)):
+            lo, hi, d = 0, self.size, 0
+            while i + d < len(s):
+                a, b = self._extend(lo, hi, s[i + d])
+                if a >= b or not seqIdxs.issubset(self._ids(a, b, d + 1)):
+                    break
+                lo, hi = a, b
+                d += 1
+            ms.append(d)
+        return ms
+
+    def evaluateLinear(self, s):
+        '''
+        :param s: the sequence for which the covering similarirty will be evaluated
+        :return: the covering simlarity for s, same result [score, lbreak, lss] as evaluateDichotomic, each segment
+        being matched once by backward search
+        '''
+        L = len(s)
+        if L==0:
+            return [1,[],[]]
+        e = self._encode(s)
+        lbreak = []
+        lss = []
+        beg = 0
+        while beg < L:
+            end = beg + max(self._interval(e, beg)[2], 1)
+            if end < L:
+                lbreak.append([s[end], end - beg])
+            lss.append(s[beg:end])
+            beg = end
+        score = (L-len(lss)+1)/L
+        return [score,lbreak,lss]
+
+    def _longestMatch(self, s, beg):
+        return self._interval(self._encode(s), beg)[2]
+
+    def _sequence(self, i):
+        '''
+        Extracts the i-th sequence from the index, by walking the reversed text backwards from the terminal symbol
+        that follows it there (the one of the sequence i-1, the rows of the terminal suffixes being 0..N-1 in the
+        decreasing order of the sequences).
+        '''
+        N = len(self.begs)
+        row = (N - i) % N
+        codes = []
+        for _ in range(self.ends[i] - self.begs[i]):
+            v, row = self._lf(row)
+            codes.append(v - 1)
+        return self._decode(codes)
+
+    def lcs(self, seqIdxs=-1):
+        """Returns the Largest Common Subsequence of sequences provided in seqIdxs.
+        If seqIdxs is not provided, the LCS of all sequences is returned.
+        Computed from the matching statistics of the shortest of these sequences, restricted to the subsequences
+        common to all of them.
+
+        ::param seqIdxs: Optional: List of indexes of sequences.
+        """
+        if seqIdxs == -1 or not isinstance(seqIdxs, list):
+            seqIdxs = list(range(len(self.word_starts)))
+        if len(seqIdxs) == 0:
+            return []
+        i = min(seqIdxs, key=lambda i: self.ends[i] - self.begs[i])
+        x = self._sequence(i)
+        if len(set(seqIdxs)) == 1:
+            return x
+        ms = self.matchingStatistics(x, seqIdxs)
+        if not ms:
+            return []
+        p = max(range(len(ms)), key=lambda p: ms[p])
+        return x[p:p + ms[p]]
@@ -0,0 +1,471 @@
+'''
+Array-backed alternative to the suffix tree of STree4CS: suffix array + LCP array stored in NumPy integer arrays.
+Queries are answered by binary search over the suffix array and by LCP intervals, with the same API as STree4CS.
+'''
+import numpy as np
+from collections import deque
+
+from .STree4CS import STree4CS
+
+
+def _suffix_array(text, levels=None):
+    '''
+    :param text: 1D NumPy integer array
+    :param levels: optional list, to which the ranks of the prefixes of length 1, 2, 4, ... of the suffixes are
+    appended (see _lcp_array)
+    :return: the suffix array of text, computed by prefix doubling (Manber and Myers, "Suffix arrays: a new method
+    for on-line string searches", 1993), each doubling step being a vectorized NumPy sort of the (rank, rank k
+    positions further) pairs packed into one integer.
+    '''
+    n = len(text)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    dtype = np.int32 if n < 2 ** 31 else np.int64
+    rank = np.unique(text, return_inverse=True)[1].astype(np.int64).reshape(n)
+    sa = np.argsort(rank, kind='stable')
+    if levels is not None:
+        levels.append(rank.astype(dtype))
+    k = 1
+    while True:
+        r = rank[sa]
+        diff = np.empty(n, dtype=np.int64)
+        diff[0] = 0
+        diff[1:] = r[1:] != r[:-1]
+        if diff.sum() == n - 1:
+            return sa
+        if k > 1:
+            rank[sa] = np.cumsum(diff)
+            if levels is not None:
+                levels.append(rank.astype(dtype))
+        key = rank * (n + 1)
+        key[:n - k] += rank[k:] + 1
+        sa = np.argsort(key)
+        rank = key
+        k *= 2
+
+
+def _lcp_array(text, sa, levels=None):
+    '''
+    :param levels: the ranks of the prefixes of length 2**j of the suffixes, for j = 0, 1, ..., as computed by
+    _suffix_array
+    :return: the LCP array of text, lcp[i] being the length of the longest common prefix of the suffixes sa[i-1]
+    and sa[i] (lcp[0] = 0), computed for all the pairs at once by binary lifting: from the longest prefixes down, the
+    common prefix of each pair is extended by 2**j when their next 2**j symbols have the same rank.
+    '''
+    n = len(text)
+    lcp = np.zeros(n, dtype=sa.dtype)
+    if n < 2:
+        return lcp
+    if levels is None:
+        levels = []
+        _suffix_array(np.asarray(text), levels)
+    p = sa[:-1].astype(np.int64)
+    q = sa[1:].astype(np.int64)
+    h = np.zeros(n - 1, dtype=np.int64)
+    for j in range(len(levels) - 1, -1, -1):
+        rank = levels[j]
+        a = p + h
+        b = q + h
+        ok = (a < n) & (b < n)
+        ok[ok] = rank[a[ok]] == rank[b[ok]]
+        h[ok] += 1 << j
+    lcp[1:] = h
+    return lcp
+
+
+def _nearest_smaller(E, step):
+    '''
+    :param E: 1D NumPy integer array, whose first (step=-1) or last (step=1) value is smaller than all the others
+    :return: for each position i, the nearest position j in the direction of step such that E[j] < E[i] (the ends
+    are their own answer), computed by pointer jumping: each candidate is replaced by its own candidate until it is
+    smaller, in O(log n) vectorized passes.
+    '''
+    n = len(E)
+    end = 0 if step < 0 else n - 1
+    cand = np.arange(n, dtype=np.int64) + step
+    cand[end] = end
+    active = np.nonzero((E[cand] >= E) & (cand != end))[0]
+    while len(active):
+        cand[active] = cand[cand[active]]
+        active = active[(E[cand[active]] >= E[active]) & (cand[active] != end)]
+    return cand
+
+
+def _tree_arrays(text, sa, lcp):
+    '''
+    Derives the suffix tree of text from its suffix array and LCP array, with vectorized passes: the internal nodes
+    are the LCP intervals (Abouelhoda et al., "Replacing suffix trees with enhanced suffix arrays", 2004), the leaves
+    the suffixes, and the suffix link of a node of depth d is the interval of depth d-1 holding the suffix that
+    follows its first one.
+
+    :return: dict of the flat arrays of the nodes (idx, depth, parent, slink) and of their children in CSR layout
+    (child_ptr, child_sym, child_id), as written by STree4CS.save(), root being node 0 and the leaf of the k-th
+    suffix of the suffix array node m+k, m being the number of internal nodes
+    '''
+    n = len(text)
+    sa = sa.astype(np.int64)
+    # E[i] = lcp[i] for 0 < i < n, with the sentinels E[0] = E[n] = -1
+    E = np.empty(n + 1, dtype=np.int64)
+    E[1:n] = lcp[1:]
+    E[0] = E[n] = -1
+    psv = _nearest_smaller(E, -1)
+    nsv = _nearest_smaller(E, 1)
+
+    # internal nodes: the distinct (depth, left bound) of the positions, plus the root (0, 0), sorted by depth
+    pos = np.arange(1, n, dtype=np.int64)
+    keys = np.concatenate([[0], E[pos] * (n + 1) + psv[pos]])
+    keys, first = np.unique(keys, return_index=True)
+    rbs = np.concatenate([[n - 1], nsv[pos] - 1])[first]
+    m = len(keys)
+    depth = keys // (n + 1)
+    lb = keys % (n + 1)
+
+    def node(d, l):
+        return np.searchsorted(keys, d * (n + 1) + l)
+
+    # parent of an interval [lb, rb]: the deepest of the intervals of E[lb] and E[rb+1]
+    parent = np.empty(m + n, dtype=np.int64)
+    parent[0] = 0
+    left = E[lb[1:]]
+    right = E[rbs[1:] + 1]
+    parent[1:m] = np.where(left >= right, node(left, psv[np.maximum(lb[1:], 1)]), node(right, psv[rbs[1:] + 1]))
+    # parent of a leaf k: the deepest of the intervals of E[k] and E[k+1]
+    k = np.arange(n, dtype=np.int64)
+    left = E[k]
+    right = E[k + 1]
+    parent[m:] = np.where(left >= right, node(np.maximum(left, 0), psv[np.maximum(k, 1)]),
+                          node(np.maximum(right, 0), psv[np.minimum(k + 1, n - 1)]))
+
+    # a node starts at its leftmost occurrence, as in a McCreight build: the least suffix of its interval
+    bounds = np.empty(2 * m, dtype=np.int64)
+    bounds[0::2] = lb
+    bounds[1::2] = rbs + 1
+    idx = np.concatenate([np.minimum.reduceat(np.append(sa, n), bounds)[0::2], sa])
+    depth = np.concatenate([depth, n - sa])
+    idx[0] = 0
+    slink = np.full(m + n, -1, dtype=np.int64)
+    slink[0] = 0
+    if m > 1:
+        rank = np.empty(n, dtype=np.int64)
+        rank[sa] = k
+        slink[1:m] = np.searchsorted(keys, (depth[1:m] - 1) * (n + 1) + rank[idx[1:m] + 1], side='right') - 1
+
+    # children, sorted by parent and by first symbol of their edge
+    child = np.arange(1, m + n, dtype=np.int64)
+    sym = np.asarray(text, dtype=np.int64)[idx[child] + depth[parent[child]]]
+    order = np.lexsort((sym, parent[child]))
+    child_ptr = np.zeros(m + n + 1, dtype=np.int64)
+    child_ptr[1:] = np.cumsum(np.bincount(parent[child], minlength=m + n))
+    return {'idx': idx, 'depth': depth, 'parent': parent, 'slink': slink, 'child_ptr': child_ptr,
+            'child_sym': sym[order], 'child_id': child[order]}
+
+
+class SArray4CS(STree4CS):
+    """Class representing the suffix array + LCP index, answering the same queries as STree4CS."""
+
+    _backend = 'sa'
+
+    def __init__(self, input='', nodeStore=False, backend='sa', bulk=False):
+        '''
+        :param input: Sequence or List of Sequences
+        :param nodeStore: ignored, there are no nodes in this index
+        :param backend: ignored, kept for compatibility with the STree4CS constructor
+        :param bulk: ignored, the suffix array is always built in bulk
+        '''
+        self.begs = []
+        self.ends = []
+        self.word_starts = []
+        self.word = np.zeros(0, dtype=np.intc)
+        self.codebook = []
+        self._codes = None
+        self.removed = set()
+        self.sa = np.zeros(0, dtype=np.int64)
+        self.lcp = np.zeros(0, dtype=np.int64)
+        if isinstance(input, np.ndarray) or not input == '':
+            self.build(input)
+
+    def _build(self, x):
+        """Builds the suffix array and the LCP array."""
+        self.word = np.asarray(x, dtype=np.intc)
+        dtype = np.int32 if len(self.word) < 2 ** 31 else np.int64
+        levels = []
+        self.sa = _suffix_array(self.word, levels).astype(dtype)
+        self.lcp = _lcp_array(self.word, self.sa, levels)
+        self._word = memoryview(self.word)
+        self._sa = memoryview(self.sa)
+
+    def __getstate__(self):
+        # the memoryviews cannot be pickled, they are rebuilt by __setstate__
+        return {k: v for k, v in super().__getstate__().items() if not isinstance(v, memoryview)}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._word = memoryview(self.word)
+        self._sa = memoryview(self.sa)
+
+    def _index_arrays(self):
+        return {'sa': self.sa, 'lcp': self.lcp}
+
+    def _load_index_arrays(self, get, word):
+        self.word = word
+        self.sa = get('sa')
+        self.lcp = get('lcp')
+        self._word = memoryview(self.word)
+        self._sa = memoryview(self.sa)
+
+    def _build_generalized(self, xs):
+        """Builds the generalized suffix array from the array of sequences provided."""
+        self._build(self._concatenate(xs))
+
+    def add_sequence(self, x):
+        raise NotImplementedError("The suffix array cannot be updated, build a new SArray4CS")
+
+    def remove_sequence(self, i):
+        raise NotImplementedError("The suffix array cannot be updated, build a new SArray4CS")
+
+    def enable_cache(self, maxsize=4096):
+        raise NotImplementedError("The suffix array has no locus cache")
+
+    def _symbol(self, k, j):
+        """Helper method that returns the j-th symbol of the k-th suffix in lexicographic order, None past the end."""
+        p = self._sa[k] + j
+        if p < len(self._word):
+            return self._word[p]
+        return None
+
+    def _narrow(self, lo, hi, j, c):
+        """Helper method that restricts the SA interval [lo, hi) of suffixes sharing a prefix of length j to the
+        suffixes whose j-th symbol is c."""
+        a, b = lo, hi
+        while a < b:
+            m = (a + b) // 2
+            x = self._symbol(m, j)
+            if x is None or x < c:
+                a = m + 1
+            else:
+                b = m
+        lo = a
+        b = hi
+        while a < b:
+            m = (a + b) // 2
+            if self._symbol(m, j) == c:
+                a = m + 1
+            else:
+                b = m
+        return lo, a
+
+    def _covers(self, lo, hi, seqIdxs):
+        """Helper method that checks whether the suffixes of the SA interval [lo, hi) start in all the sequences of
+        seqIdxs."""
+        ids = np.searchsorted(np.asarray(self.word_starts), self.sa[lo:hi], side='right') - 1
+        return seqIdxs.issubset(np.unique(ids).tolist())
+
+    def _interval(self, y, start=0, stop=None, seqIdxs=None):
+        '''
+        :return: (lo, hi, d) where [lo, hi) is the SA interval of the suffixes starting with y[start:start+d],
+        d being the length of the longest prefix of y[start:stop] found in the index (in all the sequences of
+        seqIdxs, if provided).
+        '''
+        if stop is None:
+            stop = len(y)
+        lo, hi = 0, len(self.sa)
+        d = 0
+        while start + d < stop:
+            if seqIdxs is not None:
+                a, b = self._narrow(lo, hi, d, y[start + d])
+                if a >= b or not self._covers(a, b, seqIdxs):
+                    break
+                lo, hi = a, b
+                d += 1
+                continue
+            if hi - lo == 1:
+                # a single candidate suffix left: compare symbol by symbol
+                p = self._sa[lo]
+                n = len(self._word)
+                while start + d < stop and p + d < n and self._word[p + d] == y[start + d]:
+                    d += 1
+                break
+            a, b = self._narrow(lo, hi, d, y[start + d])
+            if a >= b:
+                break
+            lo, hi = a, b
+            d += 1
+        return lo, hi, d
+
+    def find(self, y, start=0, stop=None):
+        """Returns starting position of the subsequence y[start:stop] in the sequence used for
+        building the index.
+
+        :param y: Seq
+        :param start: Optional: starting index of the subsequence in y
+        :param stop: Optional: ending index (excluded) of the subsequence in y, len(y) by default
+        :return: Index of the starting position of sequence y in the sequence used for building the index
+                 -1 if y is not a subsequence.
+        """
+        y = self._encode(y)
+        stop = len(y) if stop is None else min(stop, len(y))
+        if stop <= start:
+            return 0
+        lo, hi, d = self._interval(y, start, stop)
+        if d < stop - start:
+            return -1
+        return int(self._sa[lo])
+
+    def find_all(self, y, start=0, stop=None):
+        y = self._encode(y)
+        stop = len(y) if stop is None else min(stop, len(y))
+        if stop <= start:
+            return self.sa.tolist()
+        lo, hi, d = self._interval(y, start, stop)
+        if d < stop - start:
+            return []
+        return self.sa[lo:hi].tolist()
+
+    def count(self, y):
+        """Returns the number of occurrences of y, the size of its SA interval."""
+        y = self._encode(y)
+        lo, hi, d = self._interval(y)
+        return hi - lo if d == len(y) else 0
+
+    def doc_freq(self, y):
+        """Returns the number of distinct sequences in which y occurs."""
+        y = self._encode(y)
+        lo, hi, d = self._interval(y)
+        return self._docs(lo, hi) if d == len(y) else 0
+
+    def occurrences(self, y):
+        """Generator of the (sequence index, offset in the sequence) pairs of the occurrences of y (see getSeqId)."""
+        y = self._encode(y)
+        lo, hi, d = self._interval(y)
+        if d < len(y):
+            return
+        for k in range(lo, hi):
+            yield self.getSeqId(self._sa[k])
+
+    def _docs(self, lo, hi):
+        """Helper method that returns the number of distinct sequences of the suffixes of the SA interval [lo, hi)."""
+        ids = np.searchsorted(np.asarray(self.word_starts), self.sa[lo:hi], side='right') - 1
+        return len(np.unique(ids))
+
+    def _breaks(self, s, beg, mask):
+        """Helper generator of the (d, bits) pairs of STree4CS.evaluatePerSequence, the sequences of an SA interval
+        being found by a search in word_starts."""
+        starts = np.asarray(self.word_starts)
+        L = len(s)
+        lo, hi, d = 0, len(self.sa), 0
+        while mask:
+            if beg + d == L:
+                yield d, mask
+                return
+            lo, hi = self._narrow(lo, hi, d, s[beg + d])
+            inside = 0
+            if lo < hi:
+                for i in np.unique(np.searchsorted(starts, self.sa[lo:hi], side='right') - 1).tolist():
+                    inside |= 1 << i
+                inside &= mask
+            if mask & ~inside:
+                yield d, mask & ~inside
+            mask = inside
+            d += 1
+
+    def _matchFreq(self, s, beg):
+        lo, hi, d = self._interval(self._encode(s), beg)
+        return d, self._docs(lo, hi)
+
+    def _match_start(self):
+        return (0, len(self.sa), 0)
+
+    def _match_step(self, state, c):
+        """Helper method that narrows the SA interval (lo, hi, d) of a segment of length d to the segment extended
+        with the symbol c, None if it is not found."""
+        lo, hi, d = state
+        lo, hi = self._narrow(lo, hi, d, self._code(c))
+        if lo >= hi:
+            return None
+        return (lo, hi, d + 1)
+
+    def matchingStatistics(self, s, seqIdxs=None):
+        '''
+        :param s: a sequence
+        :param seqIdxs: Optional: List of indexes of sequences. If provided, only the subsequences common to all these
+        sequences are matched.
+        :return: the list ms of the matching statistics of s, ms[i] being the length of the longest prefix of s[i:]
+        found in the index.
+        '''
+        if seqIdxs is not None:
+            seqIdxs = set(seqIdxs)
+        s = self._encode(s)
+        return [self._interval(s, i, seqIdxs=seqIdxs)[2] for i in range(len(s))]
+
+    def evaluateLinear(self, s):
+        '''
+        :param s: the sequence for which the covering similarirty will be evaluated
+        :return: the covering simlarity for s, same result [score, lbreak, lss] as evaluateDichotomic, each segment
+        being matched once by binary search over the suffix array
+        '''
+        L = len(s)
+        if L==0:
+            return [1,[],[]]
+        e = self._encode(s)
+        lbreak = []
+        lss = []
+        beg = 0
+        while beg < L:
+            end = beg + max(self._interval(e, beg)[2], 1)
+            if end < L:
+                lbreak.append([s[end], end - beg])
+            lss.append(s[beg:end])
+            beg = end
+        score = (L-len(lss)+1)/L
+        return [score,lbreak,lss]
+
+    def _sequence(self, i):
+        return self._decode(self.word[self.begs[i]:self.ends[i]])
+
+    def _longestMatch(self, s, beg):
+        return self._interval(self._encode(s), beg)[2]
+
+    def lcs(self, seqIdxs=-1):
+        """Returns the Largest Common Subsequence of sequences provided in seqIdxs.
+        If seqIdxs is not provided, the LCS of all sequences is returned.
+        Computed with a sliding window over the suffix array covering all the requested sequences, the length of
+        the common prefix of the window being the minimum of the LCP array over it.
+
+        ::param seqIdxs: Optional: List of indexes of sequences.
+        """
+        if seqIdxs == -1 or not isinstance(seqIdxs, list):
+            seqIdxs = set(range(len(self.word_starts)))
+        else:
+            seqIdxs = set(seqIdxs)
+        if len(seqIdxs) == 0:
+            return []
+        if len(seqIdxs) == 1:
+            i = seqIdxs.pop()
+            return self._decode(self.word[self.begs[i]:self.ends[i]])
+
+        ids = np.searchsorted(np.asarray(self.word_starts), self.sa, side='right') - 1
+        positions = np.flatnonzero(np.isin(ids, list(seqIdxs))).tolist()
+        ids = ids.tolist()
+        lcp = memoryview(self.lcp)
+        counts = {}
+        window = deque()  # indexes of lcp in the window, with increasing lcp values
+        best, bestStart = 0, 0
+        left = 0
+        for right, k in enumerate(positions):
+            if right > 0:
+                for q in range(positions[right - 1] + 1, k + 1):
+                    while window and lcp[window[-1]] >= lcp[q]:
+                        window.pop()
+                    window.append(q)
+            counts[ids[k]] = counts.get(ids[k], 0) + 1
+            while len(counts) == len(seqIdxs):
+                while window and window[0] <= positions[left]:
+                    window.popleft()
+                if window and lcp[window[0]] > best:
+                    best, bestStart = lcp[window[0]], self._sa[k]
+                i = ids[positions[left]]
+                counts[i] -= 1
+                if counts[i] == 0:
+                    del counts[i]
+                left += 1
+        return self._decode(self.word[bestStart:bestStart + best])
@@ -5,24 +5,237 @@ Modified by P-F. Marteau, 9 november 2017 to cope with list of integers and cove
 Bug in the 'evaluateDichotomic()' function, corrected by François Brochard (Master 2 student at Université Bretagne Sud), 7th of March 2018
 '''
 import sys
+import os
+import json
 import numpy as np
 import math
+import heapq
+import random
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from collections import OrderedDict
+
+from .parallel import imap_shared
 
 
 class STree4CS():
     """Class representing the suffix tree."""
 
-    def __init__(self, input=''):
-        self.root = _SNode()
+    _backend = 'tree'
+    stats = None  # Stats4CS of the index, while enable_stats() is in effect
+    _cache = None  # _LocusCache of the query fragments, see enable_cache
+
+    def __new__(cls, input='', nodeStore=False, backend='tree', bulk=False):
+        if backend not in ('tree', 'sa', 'fm'):
+            raise ValueError("backend should be 'tree', 'sa' or 'fm'")
+        if cls is STree4CS and backend == 'sa':
+            from .SArray4CS import SArray4CS
+            cls = SArray4CS
+        if cls is STree4CS and backend == 'fm':
+            from .FMIndex4CS import FMIndex4CS
+            cls = FMIndex4CS
+        return object.__new__(cls)
+
+    def __init__(self, input='', nodeStore=False, backend='tree', bulk=False):
+        '''
+        :param input: Sequence or List of Sequences
+        :param nodeStore: if True, the nodes are kept in a flat integer-id _NodeStore instead of one Python object
+        per node, which cuts the memory footprint of large trees at the cost of slower node accesses. The store is
+        filled in bulk (see _build_bulk), so that the peak memory of the build stays low too
+        :param backend: 'tree' (default) for the suffix tree, 'sa' for the array-backed suffix array + LCP index
+        (see SArray4CS), which answers the same queries with a much smaller memory footprint, 'fm' for the compressed
+        FM-index (see FMIndex4CS), of about 1-2 bytes per symbol
+        :param bulk: if True, the tree is derived from the suffix array and the LCP array of the whole text with
+        vectorized NumPy passes (see _build_bulk) instead of being built symbol by symbol, the nodes being kept in a
+        _NodeStore (same as nodeStore=True)
+        '''
+        self.bulk = bulk
+        self.nodeStore = _NodeStore() if nodeStore or bulk else None
+        self.root = self._new_node()
         self.root.depth = 0
         self.root.idx = 0
         self.root.parent = self.root
         self.root._add_suffix_link(self.root)
         self.begs = []
         self.ends = []
-        if not input == '':
+        self.word = array('i')  # concatenated text, as codes of the symbols
+        self.word_starts = []
+        self.codebook = []  # symbol of each code
+        self._codes = None  # code of each symbol, None when the symbols are their own codes
+        self.removed = set()  # indexes of the sequences removed with remove_sequence, until compact()
+        self._removedMask = 0
+        self._labeled = False
+        self._counted = False
+        self._cache = None  # _LocusCache of the query fragments, see enable_cache
+        self._mined = None  # internal nodes by decreasing depth and mining caches, see _ensure_mined
+        if isinstance(input, np.ndarray) or not input == '':
             self.build(input)
 
+    @classmethod
+    def from_flat(cls, flat, offsets, **kwargs):
+        '''
+        Builds the index from sequences stored in one flat array, e.g. loaded from a .npy file, without converting
+        them to lists.
+
+        :param flat: 1D array of the concatenated sequences
+        :param offsets: array of the N+1 boundaries of the N sequences, the i-th one being flat[offsets[i]:offsets[i+1]]
+        :param kwargs: passed to the constructor (nodeStore, backend, ...)
+        '''
+        flat = np.asarray(flat)
+        offsets = np.asarray(offsets).tolist()
+        return cls([flat[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)], **kwargs)
+
+    def save(self, path):
+        '''
+        Saves the built index in the directory path, as flat binary (.npy) arrays: the concatenated word, begs, ends,
+        word_starts, removed, the codebook and, for the suffix tree, the nodes (idx, depth, parent, suffix link) and
+        their children in CSR layout (child_ptr, child_sym, child_id).
+
+        :param path: directory, created if needed
+        '''
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        arrays = self._index_arrays()
+        arrays['word'] = np.asarray(self.word)
+        arrays['begs'] = np.asarray(self.begs, dtype=np.int64)
+        arrays['ends'] = np.asarray(self.ends, dtype=np.int64)
+        arrays['word_starts'] = np.asarray(getattr(self, 'word_starts', []), dtype=np.int64)
+        arrays['removed'] = np.asarray(sorted(getattr(self, 'removed', ())), dtype=np.int64)
+        arrays['codebook'] = np.asarray(self.codebook)
+        for name, a in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), a)
+        with open(os.path.join(path, 'header.json'), 'w') as f:
+            json.dump({'backend': self._backend, 'version': 2, 'identity': self._codes is None}, f)
+
+    @staticmethod
+    def load(path, mmap=True):
+        '''
+        Loads an index saved with save().
+
+        :param path: directory written by save()
+        :param mmap: if True, the arrays are memory-mapped read-only instead of being read in memory, so that the
+        loading time is close to zero and that several processes loading the same index share its pages
+        :return: the STree4CS (SArray4CS, FMIndex4CS) index, which cannot be modified (built again) once loaded
+        '''
+        with open(os.path.join(path, 'header.json')) as f:
+            header = json.load(f)
+
+        def get(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None)
+
+        if header['backend'] == 'sa':
+            from .SArray4CS import SArray4CS
+            cls = SArray4CS
+        elif header['backend'] == 'fm':
+            from .FMIndex4CS import FMIndex4CS
+            cls = FMIndex4CS
+        else:
+            cls = STree4CS
+        st = object.__new__(cls)
+        word = get('word')
+        st.word = _MappedWord(word) if mmap else word.tolist()
+        st.begs = get('begs').tolist()
+        st.ends = get('ends').tolist()
+        st.word_starts = get('word_starts').tolist()
+        st.removed = set(get('removed').tolist())
+        if header['version'] >= 2:
+            st.codebook = get('codebook').tolist()
+        else:
+            st.codebook = []  # version 1 indexes store the symbols themselves
+        st._codes = None if header.get('identity', True) else {c: i for i, c in enumerate(st.codebook)}
+        st._removedMask = st._mask(st.removed)
+        st._load_index_arrays(get, word)
+        if st.removed:
+            st._ensure_labeled()  # the removed sequences are recognized on the labels of the nodes
+        st._path = path if mmap else None
+        return st
+
+    def __reduce_ex__(self, protocol):
+        # a memory-mapped index is pickled as its path, e.g. when it is sent to worker processes
+        if getattr(self, '_path', None) is not None:
+            return (STree4CS.load, (self._path, True))
+        if hasattr(self, 'root'):
+            # the nodes are pickled as the flat arrays written by save(), not as a graph of objects whose pickling
+            # would recurse along the paths of the tree
+            state = {k: v for k, v in self.__getstate__().items() if k not in ('root', 'nodeStore', '_cache', '_mined')}
+            cacheSize = self._cache.maxsize if self._cache is not None else None
+            return (_unpickle_tree, (type(self), state, self._index_arrays(), self.nodeStore is not None, cacheSize))
+        return object.__reduce_ex__(self, protocol)
+
+    def __getstate__(self):
+        # an index is pickled without the instrumentation of enable_stats()
+        if self.stats is None:
+            return dict(self.__dict__)
+        return self.stats.plain_state(self.__dict__)
+
+    def _index_arrays(self):
+        """Helper method that returns the nodes of the tree as a dict of flat arrays, root being node 0."""
+        if self.nodeStore is not None:
+            store = self.nodeStore
+            store.freeze()
+            columns = {'idx': store.idx, 'depth': store.depth, 'parent': store.parent, 'slink': store.slink,
+                       'child_ptr': store.child_ptr, 'child_sym': store.child_sym, 'child_id': store.child_id}
+            return {name: np.asarray(c, dtype=np.int64) for name, c in columns.items()}
+        # number the nodes in breadth-first order
+        nodes = [self.root]
+        ids = {self.root: 0}
+        i = 0
+        while i < len(nodes):
+            for c in nodes[i].transition_links.values():
+                ids[c] = len(nodes)
+                nodes.append(c)
+            i += 1
+        child_ptr = [0]
+        child_sym = []
+        child_id = []
+        for n in nodes:
+            for s, c in sorted(n.transition_links.items()):
+                child_sym.append(s)
+                child_id.append(ids[c])
+            child_ptr.append(len(child_sym))
+        columns = {'idx': [n.idx for n in nodes],
+                   'depth': [n.depth for n in nodes],
+                   'parent': [ids[n.parent] for n in nodes],
+                   'slink': [ids[n._suffix_link] if n._suffix_link is not None else -1 for n in nodes],
+                   'child_ptr': child_ptr, 'child_sym': child_sym, 'child_id': child_id}
+        return {name: np.asarray(c, dtype=np.int64) for name, c in columns.items()}
+
+    def _load_index_arrays(self, get, word):
+        """Helper method that rebuilds the tree on top of the (memory-mapped) arrays written by _index_arrays."""
+        store = _NodeStore()
+        for name in ('idx', 'depth', 'parent', 'slink', 'child_ptr', 'child_sym', 'child_id'):
+            setattr(store, name, memoryview(get(name)))
+        self.nodeStore = store
+        self.root = _SNodeRef(store, 0)
+        self._labeled = False
+        self._counted = False
+        self._mined = None
+        self._cache = None
+
+    def _unpack_index_arrays(self, arrays, nodeStore):
+        """Helper method that rebuilds the nodes of the tree from the arrays of _index_arrays, in a _NodeStore if
+        nodeStore is True, as _SNode objects otherwise, so that the tree can still be modified."""
+        if nodeStore:
+            self.nodeStore = _NodeStore.from_arrays(arrays)
+            self.root = _SNodeRef(self.nodeStore, 0)
+        else:
+            columns = {name: a.tolist() for name, a in arrays.items()}
+            ptr = columns['child_ptr']
+            syms = columns['child_sym']
+            ids = columns['child_id']
+            nodes = [_SNode(idx=i, depth=d) for i, d in zip(columns['idx'], columns['depth'])]
+            for u, node in enumerate(nodes):
+                node.parent = nodes[columns['parent'][u]]
+                if columns['slink'][u] >= 0:
+                    node._suffix_link = nodes[columns['slink'][u]]
+                node.transition_links = {syms[k]: nodes[ids[k]] for k in range(ptr[u], ptr[u + 1])}
+            self.nodeStore = None
+            self.root = nodes[0]
+        self._labeled = False
+        self._counted = False
+        self._mined = None
+
     def _check_input(self, input):
         """Checks the validity of the input.
 
@@ -30,8 +243,10 @@ class STree4CS():
         """
         if isinstance(input, str):
             return 'st'
+        elif isinstance(input, np.ndarray) and input.ndim == 2:
+            return 'gst'
         elif isinstance(input, list):
-            if all(isinstance(item, list) for item in input):
+            if all(isinstance(item, (list, tuple, np.ndarray)) for item in input):
                 return 'gst'
 
         raise ValueError("Sequence argument should be of type list or"
@@ -42,7 +257,8 @@ class STree4CS():
         If the input is of type List of Sequences:
         Generalized Suffix Tree is built.
 
-        :param x: Sequence or List of Sequences
+        :param x: Sequence or List of Sequences (lists or NumPy arrays, or a 2D NumPy array whose rows are the
+        sequences)
         """
         type = self._check_input(x)
 
@@ -54,20 +270,49 @@ class STree4CS():
 
     def _build(self, x):
         """Builds a Suffix tree."""
-        self.word = x
-        self._build_McCreight(x)
-    
-    def _build_McCreight(self, x):
+        self.word = array('i')
+        self.word.frombytes(np.asarray(x, dtype=np.intc).tobytes())
+        if self._cache is not None:
+            self._cache.clear()
+        if self.nodeStore is not None:
+            # the node arrays are filled in bulk, without the per-node dicts of an incremental build
+            self._build_bulk(self.word)
+        else:
+            self._build_McCreight(self.word)
+        if self.nodeStore is not None:
+            self.nodeStore.freeze()
+
+    def _build_bulk(self, x):
+        """Builds the Suffix tree of x from its suffix array and LCP array, computed by prefix doubling and derived
+        into the node arrays of a _NodeStore (see SArray4CS._tree_arrays), without any loop over the symbols. The
+        tree is the one of McCreight's algorithm, up to the numbering of its nodes."""
+        from .SArray4CS import _suffix_array, _lcp_array, _tree_arrays
+        text = np.asarray(x, dtype=np.intc)
+        if len(text) == 0:
+            return
+        levels = []
+        sa = _suffix_array(text, levels)
+        lcp = _lcp_array(text, sa, levels)
+        store = _NodeStore.from_arrays(_tree_arrays(text, sa, lcp))
+        self.nodeStore = store
+        self.root = _SNodeRef(store, 0)
+        self._labeled = False
+        self._counted = False
+        self._mined = None
+
+    def _build_McCreight(self, x, start=0):
         """Builds a Suffix tree using McCreight O(n) algorithm.
         Algorithm based on:
         McCreight, Edward M. "A space-economical suffix tree construction algorithm." - ACM, 1976.
         Implementation based on:
         UH CS - 58093 String Processing Algorithms Lecture Notes
+
+        :param start: index of the first suffix of x to insert, the previous ones being already in the tree
         """
         u = self.root
         d = 0
         lx=len(x)
-        for i in range(lx):
+        for i in range(start, lx):
             while u.depth == d and i+d<lx and u._has_transition(x[d + i]):
                 u = u._get_transition_link(x[d + i])
                 d = d + 1
@@ -83,10 +328,17 @@ class STree4CS():
             if d < 0:
                 d = 0
 
+    def _new_node(self, idx=-1, depth=-1):
+        if self.nodeStore is not None:
+            return self.nodeStore.new_node(idx=idx, depth=depth)
+        return _SNode(idx=idx, depth=depth)
+
     def _create_node(self, x, u, d):
         i = u.idx
         p = u.parent
-        v = _SNode(idx=i, depth=d)
+        v = self._new_node(idx=i, depth=d)
+        if self._labeled:
+            v.generalized_idxs = self._labels(u)
         v._add_transition_link(u, x[i + d])
         u.parent = v
         p._add_transition_link(v, x[i + p.depth])
@@ -94,11 +346,17 @@ class STree4CS():
         return v
 
     def _create_leaf(self, x, i, u, d):
-        w = _SNode()
+        w = self._new_node()
         w.idx = i
         w.depth = len(x) - i
         u._add_transition_link(w, x[i + d])
         w.parent = u
+        if self._labeled:
+            # w is a suffix of the sequence being added: label its ancestors
+            bit = 1 << (len(self.word_starts) - 1)
+            while not u.generalized_idxs & bit:
+                u.generalized_idxs |= bit
+                u = u.parent
         return w
 
     def _compute_slink(self, x, u):
@@ -110,84 +368,410 @@ class STree4CS():
             v = self._create_node(x, v, d - 1)
         u._add_suffix_link(v)
 
-    def _build_Ukkonen(self, x):
-        """Builds a Suffix tree using Ukkonen's online O(n) algorithm.
-        Algorithm based on:
-        Ukkonen, Esko. "On-line construction of suffix trees." - Algorithmica, 1995.
-        """
-        # TODO.
-        raise NotImplementedError()
-
     def _build_generalized(self, xs):
         """Builds a Generalized Suffix Tree (GST) from the array of sequences provided.
         """
-        terminal_gen = self._terminalSymbolsGenerator()
+        self._build(self._concatenate(xs))
 
-        # _xs = [x + next(terminal_gen) for x in xs]
-        _xs = []
-        n = 0
-        beg = 0
-        for x in xs:
-            end = beg + len(x)
-            self.begs.append(beg)
-            self.ends.append(end)
-            _xs += x + next(terminal_gen)
-            n += 1
-            beg = end + 1
-        self.word = _xs
-        self._generalized_word_starts(xs)
-        self._build(_xs)
-        self.root._traverse(self._label_generalized)
+    def add_sequence(self, x):
+        '''
+        Appends the sequence x to the generalized suffix tree, without rebuilding it: the suffixes of x are inserted by
+        resuming McCreight's algorithm on the extended word, the unique terminal symbol of x ensuring that the suffixes
+        already in the tree are unaffected. The cost is proportional to the length of x (plus the labeling of the
+        ancestors of its leaves, if the nodes are labeled).
+
+        :param x: Sequence (list or NumPy array)
+        :return: the index of x among the sequences of the tree
+        '''
+        if self.nodeStore is not None and not isinstance(self.nodeStore.idx, array):
+            raise ValueError("A loaded index cannot be modified")
+        seqId = len(self.begs)
+        beg = len(self.word)
+        self.begs.append(beg)
+        self.ends.append(beg + len(x))
+        self.word_starts.append(beg)
+        self.word.extend(self._encode_new(x))
+        self.word.append(-(seqId + 1))
+        self._counted = False
+        self._mined = None
+        if self._cache is not None:
+            self._cache.clear()  # the loci of the fragments may have been split
+        self._build_McCreight(self.word, beg)
+        if self.nodeStore is not None:
+            self.nodeStore.freeze(0.25)  # pack the new children once they are a good part of the tree
+        return seqId
+
+    def remove_sequence(self, i):
+        '''
+        Retires the i-th sequence: it is lazily deleted, i.e. ignored by the queries but kept in the tree until
+        compact() is called.
+
+        :param i: index of the sequence
+        '''
+        self._ensure_labeled()
+        self.removed.add(i)
+        self._removedMask |= 1 << i
+        self._counted = False
+        self._mined = None
+
+    def compact(self):
+        '''
+        Rebuilds the tree from the sequences that have not been removed, which are renumbered in the same order.
+
+        :return: the list of the previous indexes of the sequences kept, i.e. the new index of a kept sequence is its
+        position in this list
+        '''
+        kept = [i for i in range(len(self.begs)) if i not in self.removed]
+        xs = [self._sequence(i) for i in kept]
+        cache = self._cache
+        self.__init__(nodeStore=self.nodeStore is not None, bulk=getattr(self, 'bulk', False))
+        self._cache = cache
+        if xs:
+            self.build(xs)
+        return kept
+
+    def _is_removed(self, node):
+        """Helper method that checks whether all the occurrences below node belong to removed sequences."""
+        return self.removed and not self._labels(node) & ~self._removedMask
+
+    def _concatenate(self, xs):
+        """Helper method that encodes and concatenates the sequences, each one followed by its own terminal symbol
+        (the i-th sequence by -(i+1)), and records their boundaries in begs, ends and word_starts.
+
+        The symbols are replaced by dense codes 0..k-1 (see codebook), unless they already are the integers 0..k-1.
+
+        :return: the concatenated text, as a 1D NumPy array of 32 bits codes
+        """
+        xs = [np.asarray(x).ravel() for x in xs]
+        lengths = np.array([len(x) for x in xs], dtype=np.int64)
+        nonempty = [x for x in xs if len(x)]
+        flat = np.concatenate(nonempty) if nonempty else np.zeros(0, dtype=np.int64)
+        symbols, codes = np.unique(flat, return_inverse=True)
+        self.codebook = symbols.tolist()
+        if flat.dtype.kind in 'iu' and (len(symbols) == 0 or (symbols[0] == 0 and symbols[-1] == len(symbols) - 1)):
+            self._codes = None
+            codes = flat
+        else:
+            self._codes = {c: i for i, c in enumerate(self.codebook)}
+
+        begs = np.zeros(len(xs), dtype=np.int64)
+        begs[1:] = np.cumsum(lengths + 1)[:-1]
+        ends = begs + lengths
+        text = np.empty(len(flat) + len(xs), dtype=np.intc)
+        text[ends] = -np.arange(1, len(xs) + 1)
+        symbol = np.ones(len(text), dtype=bool)
+        symbol[ends] = False
+        text[symbol] = codes.ravel()
+        self.begs = begs.tolist()
+        self.ends = ends.tolist()
+        self.word_starts = list(self.begs)
+        return text
+
+    def _encode(self, s):
+        """Helper method that returns the codes of the symbols of the query s, a symbol absent from the codebook
+        being given a code that matches nothing. The queries already encoded are returned as is."""
+        if isinstance(s, _Codes):
+            return s
+        if isinstance(s, np.ndarray):
+            s = s.tolist()
+        elif self._codes is None:
+            return s
+        if self._codes is None:
+            return _Codes(s)
+        codes = self._codes
+        unknown = len(self.codebook)
+        return _Codes(codes.get(c, unknown) for c in s)
+
+    def _code(self, c):
+        """Helper method that returns the code of the symbol c of a query (see _encode)."""
+        if self._codes is None:
+            return c
+        return self._codes.get(c, len(self.codebook))
+
+    def _encode_new(self, x):
+        """Helper method that returns the codes of the symbols of the sequence x being added, new symbols being
+        appended to the codebook."""
+        x = x.tolist() if isinstance(x, np.ndarray) else list(x)
+        cb = self.codebook
+        if self._codes is None:
+            if len(x) == 0:
+                return []
+            if all(type(c) is int for c in x) and min(x) >= 0 and max(x) < len(cb) + len(x):
+                # the symbols remain their own codes
+                cb.extend(range(len(cb), max(x) + 1))
+                return x
+            self._codes = {c: i for i, c in enumerate(cb)}
+        codes = self._codes
+        out = []
+        for c in x:
+            i = codes.get(c)
+            if i is None:
+                i = codes[c] = len(cb)
+                cb.append(c)
+            out.append(i)
+        return out
+
+    def _decode(self, codes):
+        """Helper method that returns the symbols of a list of codes of the text (terminal symbols are kept)."""
+        codes = codes.tolist() if isinstance(codes, np.ndarray) else list(codes)
+        if self._codes is None:
+            return codes
+        cb = self.codebook
+        return [cb[c] if c >= 0 else c for c in codes]
 
     def _label_generalized(self, node):
-        """Helper method that labels the nodes of GST with indexes of sequences
-        found in their descendants.
+        """Helper method that labels the internal nodes of GST with the indexes of sequences
+        found in their descendants, as an integer bitset (bit i set for the i-th sequence).
+        The labels of the leaves are not stored, see _labels.
         """
+        if not node.is_leaf():
+            x = 0
+            for c in node.transition_links.values():
+                x |= self._labels(c)
+            node.generalized_idxs = x
+
+    def _labels(self, node):
+        """Helper method that returns the bitset of the indexes of sequences found below node."""
         if node.is_leaf():
-            x = {self._get_word_start_index(node.idx)}
-        else:
-            x = {n for ns in node.transition_links for n in ns[0].generalized_idxs}
-        node.generalized_idxs = x
+            return 1 << self._get_word_start_index(node.idx)
+        return node.generalized_idxs
+
+    def _ensure_labeled(self):
+        """Helper method that labels the nodes of GST, which is only done when a query needs the labels
+        (lcs, restriction to some sequences or removed sequences)."""
+        if not self._labeled:
+            self.root._traverse(self._label_generalized)
+            self._labeled = True
+
+    def _count_node(self, node):
+        """Helper method that stores on an internal node the number of occurrences (leaves of the sequences not
+        removed) below it, and the number of distinct sequences they belong to."""
+        if not node.is_leaf():
+            node.leaf_count = sum(self._occurrence_count(c) for c in node.transition_links.values())
+            node.seq_count = bin(self._labels(node) & ~self._removedMask).count('1')
+
+    def _occurrence_count(self, node):
+        """Helper method that returns the number of occurrences below node."""
+        if node.is_leaf():
+            return 0 if self._get_word_start_index(node.idx) in self.removed else 1
+        return node.leaf_count
+
+    def _sequence_count(self, node):
+        """Helper method that returns the number of distinct sequences below node."""
+        if node.is_leaf():
+            return self._occurrence_count(node)
+        return node.seq_count
+
+    def _ensure_counted(self):
+        """Helper method that computes the counts of the nodes of the tree in one bottom-up pass, labeling them at
+        the same time if needed. The counts are recomputed after the tree is modified."""
+        if not self._counted:
+            labeled = self._labeled
+
+            def count(node):
+                if not labeled:
+                    self._label_generalized(node)
+                self._count_node(node)
+
+            self.root._traverse(count)
+            self._labeled = True
+            self._counted = True
+
+    def _mask(self, seqIdxs):
+        """Helper method that returns the bitset of a collection of indexes of sequences."""
+        mask = 0
+        for i in seqIdxs:
+            mask |= 1 << i
+        return mask
 
     def _get_word_start_index(self, idx):
         """Helper method that returns the index of the sequence based on node's
         starting index"""
-        i = 0
-        for _idx in self.word_starts[1:]:
-            if idx < _idx:
-                return i
-            else:
-                i += 1
-        return i
+        return max(bisect_right(self.word_starts, idx) - 1, 0)
 
     def lcs(self, seqIdxs=-1):
         """Returns the Largest Common Subsequence of sequences provided in seqIdxs.
         If seqIdxs is not provided, the LCS of all sequences is returned.
+        The deepest node of each set of sequences is cached until the tree is modified.
 
         ::param seqIdxs: Optional: List of indexes of sequences.
         """
-        if seqIdxs == -1 or not isinstance(seqIdxs, list):
-            seqIdxs = set(range(len(self.word_starts)))
+        return self.lcs_many([seqIdxs])[0]
+
+    def lcs_many(self, subsets):
+        '''
+        :param subsets: list of lists of indexes of sequences (or -1 for all the sequences)
+        :return: the list of the lcs() of each subset, found in one scan of the internal nodes by decreasing depth
+        (see _ensure_mined) for the subsets of at least two sequences that are not cached yet
+        '''
+        if not hasattr(self, 'root'):
+            return [self.lcs(seqIdxs) for seqIdxs in subsets]
+        masks = []
+        for seqIdxs in subsets:
+            if seqIdxs == -1 or not isinstance(seqIdxs, list):
+                seqIdxs = set(range(len(self.word_starts))) - self.removed
+            masks.append(self._mask(set(seqIdxs)))
+        mined = self._ensure_mined()
+        found = {}
+        todo = set()
+        for mask in masks:
+            if mask in mined[2]:
+                found[mask] = mined[2][mask]
+            elif bin(mask).count('1') < 2:
+                # no sequence or a single one, which is its own lcs (as with the other backends)
+                found[mask] = self._sequence(mask.bit_length() - 1) if mask else []
+            else:
+                todo.add(mask)
+        if todo:
+            for node in mined[0]:
+                label = self._labels(node)
+                for mask in [m for m in todo if label & m == m]:
+                    found[mask] = mined[2][mask] = node
+                    todo.discard(mask)
+                if not todo:
+                    break
+            for mask in todo:
+                found[mask] = mined[2][mask] = self.root
+        out = []
+        for mask in masks:
+            node = found[mask]
+            if isinstance(node, list):
+                out.append(node)
+            else:
+                out.append(self._decode(self.word[node.idx:node.idx + node.depth]))
+        return out
+
+    def _ensure_mined(self):
+        '''
+        Helper method that lists, in one bottom-up pass over the labeled tree, its internal nodes by decreasing depth
+        (in depth-first order on ties), with their maximality: whether the occurrences of their label are preceded
+        by at least two distinct symbols (or start a sequence), and still followed by two distinct ones once the
+        removed sequences are left out. The list is kept until the tree is modified,
+        together with the supports computed on it and the lcs of the subsets of sequences already queried.
+
+        :return: (nodes, maximality flags, lcs cache mask -> node, supports cache mask -> array of the numbers of sequences of
+        the mask below each node)
+        '''
+        if not hasattr(self, 'root'):
+            raise NotImplementedError("Mining the repeats needs the suffix tree backend")
+        if self._mined is None:
+            self._ensure_counted()
+            word = self.word
+            removed = self.removed
+            START = -1  # left symbol of a suffix starting a sequence, distinct from all the others
+            DIVERSE = -2
+            left = {}
+            nodes = []
+            flags = []
+
+            def visit(node):
+                if node.is_leaf():
+                    i = node.idx
+                    if removed and self._get_word_start_index(i) in removed:
+                        left[node] = None
+                    else:
+                        left[node] = word[i - 1] if i > 0 and word[i - 1] >= 0 else START
+                    return
+                c = None
+                live = 0
+                for child in node.transition_links.values():
+                    lc = left.pop(child)
+                    if lc is None:
+                        continue
+                    live += 1
+                    if c is None:
+                        c = lc
+                    elif lc != c or c < 0:
+                        c = DIVERSE
+                if c == START:
+                    c = DIVERSE
+                left[node] = c
+                nodes.append(node)
+                flags.append(c == DIVERSE and live > 1)
+
+            self.root._traverse(visit)
+            order = sorted(range(len(nodes)), key=lambda i: -nodes[i].depth)
+            diverse = [flags[i] for i in order]
+            self._mined = ([nodes[i] for i in order], diverse, {}, OrderedDict())
+        return self._mined
+
+    def _supports(self, mask):
+        """Helper method that returns the numbers of sequences of the bitset mask below each node of the list of
+        _ensure_mined, kept in a small LRU cache so that repeated queries on the same sequences are not recomputed."""
+        nodes, diverse, lcsCache, cache = self._ensure_mined()
+        supports = cache.get(mask)
+        if supports is None:
+            supports = array('i', (bin(self._labels(n) & mask).count('1') for n in nodes))
+            cache[mask] = supports
+            if len(cache) > 16:
+                cache.popitem(last=False)
         else:
-            seqIdxs = set(seqIdxs)
+            cache.move_to_end(mask)
+        return supports
 
-        deepestNode = self._find_lcs(self.root, seqIdxs)
-        start = deepestNode.idx
-        end = deepestNode.idx + deepestNode.depth
-        return self.word[start:end]
+    def maximal_repeats(self, minLength=1, minCount=2):
+        '''
+        :param minLength: minimum length of the repeats
+        :param minCount: minimum number of occurrences of the repeats
+        :return: generator of the (repeat, number of occurrences) of the maximal repeats of the sequences, by
+        decreasing length: the subsequences occurring at least twice that can be extended neither to the right
+        (internal nodes) nor to the left (their occurrences are preceded by distinct symbols) without losing
+        occurrences
+        '''
+        nodes, diverse = self._ensure_mined()[:2]
+        for node, d in zip(nodes, diverse):
+            if node.depth < max(minLength, 1):
+                return
+            if d and self._occurrence_count(node) >= minCount:
+                yield self._decode(self.word[node.idx:node.idx + node.depth]), self._occurrence_count(node)
 
-    def _find_lcs(self, node, seqIdxs):
-        """Helper method that finds LCS by traversing the labeled GSD."""
-        nodes = [self._find_lcs(n, seqIdxs)
-                 for (n, _) in node.transition_links
-                 if n.generalized_idxs.issuperset(seqIdxs)]
+    def common_substrings(self, m=2, minLength=1, seqIdxs=None):
+        '''
+        :param m: minimum number of sequences holding the substrings
+        :param minLength: minimum length of the substrings
+        :param seqIdxs: Optional: List of indexes of sequences, the substrings being counted in these sequences only
+        :return: generator of the (substring, number of sequences) of the substrings common to at least m of the
+        sequences, by decreasing length (all the ties are generated), that cannot be extended to the right without
+        falling below m sequences
+        '''
+        if seqIdxs is None:
+            seqIdxs = range(len(self.begs))
+        mask = self._mask(seqIdxs) & ~self._removedMask
+        nodes = self._ensure_mined()[0]
+        supports = self._supports(mask)
+        for i, node in enumerate(nodes):
+            if node.depth < max(minLength, 1):
+                return
+            if supports[i] < m:
+                continue
+            if any(bin(self._labels(c) & mask).count('1') >= m for c in node.transition_links.values()):
+                continue
+            yield self._decode(self.word[node.idx:node.idx + node.depth]), supports[i]
 
-        if nodes == []:
-            return node
+    def topk_common_substrings(self, k, m=2, minLength=1, seqIdxs=None):
+        '''
+        :return: the list of the k longest (substring, number of sequences) of common_substrings(m, minLength,
+        seqIdxs)
+        '''
+        return list(islice(self.common_substrings(m, minLength, seqIdxs), k))
 
-        deepestNode = max(nodes, key=lambda n: n.depth)
+    def _find_lcs(self, node, mask):
+        """Helper method that finds LCS by traversing the labeled GSD: the deepest node whose labels contain the
+        bitset mask, the first one in depth-first order on ties."""
+        deepestNode = node
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n.depth > deepestNode.depth:
+                deepestNode = n
+            stack.extend(c for c in reversed(list(n.transition_links.values()))
+                         if self._labels(c) & mask == mask)
         return deepestNode
 
+    def _sequence(self, i):
+        """Helper method that returns the i-th sequence used for building the GST."""
+        return self._decode(self.word[self.begs[i]:self.ends[i]])
+
     def _generalized_word_starts(self, xs):
         """Helper method returns the starting indexes of sequences in GST"""
         self.word_starts = []
@@ -196,59 +780,175 @@ class STree4CS():
             self.word_starts.append(i)
             i += len(xs[n]) + 1
 
-    def find(self, y):
-        """Returns starting position of the subsequence y in the sequence used for
-        building the Suffix tree.
+    def find(self, y, start=0, stop=None):
+        """Returns starting position of the subsequence y[start:stop] in the sequence used for
+        building the Suffix tree. y is not copied: the symbols are compared in place.
 
         :param y: Seq
+        :param start: Optional: starting index of the subsequence in y
+        :param stop: Optional: ending index (excluded) of the subsequence in y, len(y) by default
         :return: Index of the starting position of sequence y in the sequence used for building the Suffix tree
                  -1 if y is not a subsequence.
         """
-        node = self.root
-        while True:
-            edge = self._edgeLabel(node, node.parent)
-            if edge[:len(y)] == y:  # edge.startswith(y):
-                return node.idx
-
-            i = 0
-            while (i < len(edge) and edge[i] == y[0]):
-                y = y[1:]
-                i += 1
-
-            if i != 0:
-                if i == len(edge) and y != []:
-                    pass
-                else:
-                    return -1
-
-            node = node._get_transition_link(y[0])
-            if not node:
+        y = self._encode(y)
+        stop = len(y) if stop is None else min(stop, len(y))
+        node = self._locate(y, start, stop)
+        if node is None:
+            return -1
+        if self.removed and start < stop:
+            if self._is_removed(node):
                 return -1
+            # walk down through the live children only, to the first live leaf
+            while not node.is_leaf():
+                node = next(c for c in node.transition_links.values() if not self._is_removed(c))
+        return node.idx
 
-    def find_all(self, y):
-        node = self.root
-        while True:
-            edge = self._edgeLabel(node, node.parent)
-            if edge[:len(y)] == y:  # edge.startswith(y):
-                break
+    def find_all(self, y, start=0, stop=None):
+        """Returns the starting positions of all the occurrences of y[start:stop] (see find)."""
+        y = self._encode(y)
+        stop = len(y) if stop is None else min(stop, len(y))
+        node = self._locate(y, start, stop)
+        if node is None:
+            return []
+        leaves = node._get_leaves()
+        if self.removed:
+            return [n.idx for n in leaves if self._get_word_start_index(n.idx) not in self.removed]
+        return [n.idx for n in leaves]
 
-            i = 0
-            while (i < len(edge) and edge[i] == y[0]):
-                y = y[1:]
-                i += 1
+    def count(self, y):
+        '''
+        :param y: Seq
+        :return: the number of occurrences of y in the sequence(s) used for building the Suffix tree, read on the
+        node reached by y (the counts of the nodes are computed once, at the first call)
+        '''
+        y = self._encode(y)
+        node = self._locate(y, 0, len(y))
+        if node is None:
+            return 0
+        self._ensure_counted()
+        return self._occurrence_count(node)
 
-            if i != 0:
-                if i == len(edge) and y != []:
-                    pass
-                else:
-                    return []
+    def doc_freq(self, y):
+        '''
+        :param y: Seq
+        :return: the number of distinct sequences in which y occurs
+        '''
+        y = self._encode(y)
+        node = self._locate(y, 0, len(y))
+        if node is None:
+            return 0
+        self._ensure_counted()
+        return self._sequence_count(node)
 
-            node = node._get_transition_link(y[0])
-            if not node:
-                return []
+    def occurrences(self, y):
+        '''
+        :param y: Seq
+        :return: generator of the (sequence index, offset in the sequence) pairs of the occurrences of y (see
+        getSeqId), the leaves being enumerated lazily
+        '''
+        y = self._encode(y)
+        node = self._locate(y, 0, len(y))
+        if node is None:
+            return
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n.is_leaf():
+                if not self.removed or self._get_word_start_index(n.idx) not in self.removed:
+                    yield self.getSeqId(n.idx)
+            else:
+                stack.extend(reversed(list(n.transition_links.values())))
 
-        leaves = node._get_leaves()
-        return [n.idx for n in leaves]
+    def enable_cache(self, maxsize=4096):
+        '''
+        Caches the loci reached in the tree by the query fragments looked up by find (and thus by the evaluations),
+        so that repeated fragments are not matched again, and that a fragment extending the one located last
+        resumes matching from its locus instead of from the root. The fragments are keyed by a hash of constant size,
+        computed in constant time for the queries being evaluated. The least recently used fragments are evicted
+        first, and the cache is cleared whenever the tree changes.
+
+        :param maxsize: maximum number of fragments cached
+        '''
+        self._cache = _LocusCache(maxsize)
+
+    def disable_cache(self):
+        self._cache = None
+
+    def cache_info(self):
+        '''
+        :return: the statistics of the cache, as a dict (hits, misses, resumed i.e. misses resumed from the locus of
+        the prefix located last, size, maxsize), None if there is no cache
+        '''
+        if self._cache is None:
+            return None
+        return self._cache.info()
+
+    def _locate(self, y, start, stop):
+        """Helper method that walks down the tree along y[start:stop], comparing the symbols of y with those of
+        the word in place.
+
+        :return: the node ending the edge where the match of y[start:stop] ends (root if it is empty),
+                 None if y[start:stop] is not a subsequence.
+        """
+        cache = self._cache
+        if cache is None:
+            return self._descend(y, start, stop, self.root, 0)
+        n = stop - start
+        hint = cache.hint
+        same = hint is not None and hint[0] is y and hint[1] == start
+        if same:
+            # the fragments of y at start are answered from the longest one matched last: found on its path up to
+            # its length, absent beyond it if its match failed there
+            length, locus, failed = hint[2], hint[3], hint[4]
+            if n <= length:
+                cache.hits += 1
+                while locus.depth > 0 and locus.parent.depth >= n:
+                    locus = locus.parent
+                return locus
+            if failed:
+                cache.hits += 1
+                return None
+        key = cache.key(y, start, stop)
+        hit, node = cache.get(key)
+        if hit:
+            return node
+        base, d = self.root, 0
+        if same:
+            base, d = hint[3], hint[2]
+            cache.resumed += 1
+        node, d = self._descend(y, start, stop, base, d, partial=True)
+        if isinstance(y, _Codes):
+            cache.hint = (y, start, d, node, d < n)
+        if d < n:
+            node = None
+        cache.put(key, node)
+        return node
+
+    def _descend(self, y, start, stop, node, d, partial=False):
+        """Helper method that goes on matching y[start:stop] from the locus of its prefix of length d, which ends on
+        the edge ending at node (see _locate).
+
+        :param partial: if True, returns the (locus, length) of the longest prefix of y[start:stop] matched, instead of
+        the locus of y[start:stop] or None
+        """
+        word = self.word
+        n = stop - start
+        idx = node.idx
+        end = min(node.depth, n)
+        while True:
+            while d < end:
+                if word[idx + d] != y[start + d]:
+                    return (node, d) if partial else None
+                d += 1
+            if d == n:
+                return (node, d) if partial else node
+            child = node._get_transition_link(y[start + d])
+            if not child:
+                return (node, d) if partial else None
+            node = child
+            d += 1
+            idx = node.idx
+            end = min(node.depth, n)
 
     def _edgeLabel(self, node, parent):
         """Helper method, returns the edge label between a node and it's parent"""
@@ -257,49 +957,59 @@ class STree4CS():
     def _terminalSymbolsGenerator(self):
         """Generator of unique terminal symbols used for building the Generalized Suffix Tree.
         negative integer is used to ensure that terminal symbols
-        are not part of the input sequence.
+        are not part of the input sequence. The i-th sequence gets -i, with no bound on the number of sequences.
         """
-        UPPAs = [i for i in range(1, 1000000)]
-        for i in UPPAs:
+        i = 1
+        while True:
             yield ([-i])
-        raise ValueError("Too many input sequences.")
+            i += 1
 
-    def getNextBreakDichotomic(self, s):
+    def _query(self, s):
+        """Helper method that returns the codes of the query s being evaluated (see _encode), as a _Codes when the
+        locus cache is enabled, so that the cache can keep the hashes of its prefixes during the evaluation."""
+        e = self._encode(s)
+        if self._cache is not None and not isinstance(e, _Codes):
+            e = _Codes(e)
+        return e
+
+    def getNextBreakDichotomic(self, s, start=0):
         '''
         :param s: a subsequence
+        :param start: Optional: the search is made on s[start:], without copying it
         :return: returns the index t corresponding to the next break, i.e. the location where the current subsequence of the covering will end
         '''
-        beg = 0
+        s = self._query(s)
+        beg = start
         end = len(s)
         t = int((beg + end) / 2)
         t0 = beg
         while True:
             # print(t,beg,end)
-            srch = self.find(s[beg:t])
+            srch = self.find(s, beg, t)
             while srch >= 0 and np.abs(t - end) > 1:
                 # print('.',end='',flush=True)
                 t0 = t
                 t = int((t + end) / 2)
-                srch = self.find(s[beg:t])
+                srch = self.find(s, beg, t)
             if np.abs(t0 - end) <= 1:
                 break
-            srch = self.find(s[beg:t])
+            srch = self.find(s, beg, t)
             while srch < 0 and np.abs(t - t0) > 1:
                 # print('*', end='', flush=True)
                 t = int((t0 + t) / 2)
-                srch = self.find(s[beg:t])
+                srch = self.find(s, beg, t)
             if np.abs(t - t0) <= 1:
                 break
 
-        while self.find(s[beg:t]) < 0 and t > 0:
+        while self.find(s, beg, t) < 0 and t > beg:
             # print(t, end=' ', flush=True)
             t -= 1
-        while self.find(s[beg:t]) >= 0 and t <= end:
+        while self.find(s, beg, t) >= 0 and t <= end:
             # print('+', end='', flush=True)
             t += 1
         '''if(t<len(s)):
-            print('!!',self.find(s[beg:t]))'''
-        return t
+            print('!!',self.find(s, beg, t))'''
+        return t - start
 
     def evaluateDichotomic(self, s):
         '''
@@ -313,11 +1023,12 @@ class STree4CS():
         L = len(s)
         if L==0:
             return [1,[],[]]
+        e = self._query(s)
         lbreak = []
         lss = []
         beg = 0
         while beg<L :
-            end = self.getNextBreakDichotomic(s[beg:]) + beg -1
+            end = self.getNextBreakDichotomic(e, beg) + beg -1
             if end == beg : #if s[beg] isn't in the tree
                end+=1
             if end<L :
@@ -327,6 +1038,284 @@ class STree4CS():
         score = (L-len(lss)+1)/L
         return [score,lbreak,lss]
 
+    def matchingStatistics(self, s, seqIdxs=None):
+        '''
+        :param s: a sequence
+        :param seqIdxs: Optional: List of indexes of sequences. If provided, only the subsequences common to all these
+        sequences are matched.
+        :return: the list ms of the matching statistics of s, i.e. ms[i] is the length of the longest prefix of s[i:]
+        that is a subsequence of the sequence(s) used for building the Suffix tree.
+        The whole list is computed in one left-to-right pass over s using the suffix links created by McCreight's
+        algorithm (Chang and Lawler, "Sublinear approximate string matching and biological applications", 1994).
+        '''
+        if seqIdxs is not None:
+            mask = self._mask(seqIdxs)
+            self._ensure_labeled()
+        s = self._encode(s)
+        word = self.word
+        removed = self.removed
+        root = self.root
+        L = len(s)
+        ms = [0] * L
+        node = root  # deepest explicit node on the current match
+        child = None  # node whose incoming edge holds the end of the current match (None if it ends on node)
+        d = 0
+        for i in range(L):
+            # extend the current match as far as possible
+            while i + d < L:
+                if d == node.depth:
+                    child = node._get_transition_link(s[i + d])
+                    if (not child or (seqIdxs is not None and self._labels(child) & mask != mask)
+                            or (removed and self._is_removed(child))):
+                        child = None
+                        break
+                if word[child.idx + d] != s[i + d]:
+                    break
+                d += 1
+                if d == child.depth:
+                    node = child
+                    child = None
+            ms[i] = d
+            if d == 0:
+                continue
+            # drop the first symbol of the match: follow the suffix link, then rescan down to depth d-1
+            d -= 1
+            node = node._get_suffix_link()
+            if not node or node.depth > d:
+                node = root
+            child = None
+            while node.depth < d:
+                c = node._get_transition_link(s[i + 1 + node.depth])
+                if c.depth > d:
+                    child = c
+                    break
+                node = c
+        return ms
+
+    def evaluateLinear(self, s):
+        '''
+        :param s: the sequence for which the covering similarirty will be evaluated
+        :return: the covering simlarity for s, same result [score, lbreak, lss] as evaluateDichotomic, but evaluated in
+        linear time from the matching statistics of s
+        '''
+        L = len(s)
+        if L==0:
+            return [1,[],[]]
+        ms = self.matchingStatistics(s)
+        lbreak = []
+        lss = []
+        beg = 0
+        while beg < L:
+            end = beg + max(ms[beg], 1)
+            if end < L:
+                lbreak.append([s[end], end - beg])
+            lss.append(s[beg:end])
+            beg = end
+        score = (L-len(lss)+1)/L
+        return [score,lbreak,lss]
+
+    def _longestMatch(self, s, beg):
+        """Helper method that returns the length of the longest prefix of s[beg:] found in the tree."""
+        return self._longestMatchNode(s, beg)[0]
+
+    def _longestMatchNode(self, s, beg):
+        """Helper method that returns (d, node), d being the length of the longest prefix of s[beg:] found in the
+        tree and node the node ending the edge where this prefix ends (root if d is 0)."""
+        s = self._encode(s)
+        word = self.word
+        L = len(s)
+        node = self.root
+        d = 0
+        while beg + d < L:
+            child = node._get_transition_link(s[beg + d])
+            if not child or self._is_removed(child):
+                break
+            d += 1
+            while d < child.depth and beg + d < L and word[child.idx + d] == s[beg + d]:
+                d += 1
+            node = child
+            if d < child.depth:
+                break
+        return d, node
+
+    def _matchFreq(self, s, beg):
+        """Helper method that returns the length of the longest prefix of s[beg:] found in the tree, and the number of
+        distinct sequences in which it occurs."""
+        d, node = self._longestMatchNode(s, beg)
+        self._ensure_counted()
+        return d, self._sequence_count(node)
+
+    def evaluateBounded(self, s, minScore=None):
+        '''
+        :param s: the sequence for which the covering similarirty will be evaluated
+        :param minScore: optional lower bound on the score
+        :return: the covering [score, lbreak, lss] of s, same result as evaluateDichotomic, or None as soon as the
+        number of segments already found makes the score lower than minScore (the segments are matched one after
+        the other from the root, so the remaining of s is not evaluated)
+        '''
+        L = len(s)
+        if L==0:
+            return [1,[],[]]
+        e = self._encode(s)
+        lbreak = []
+        lss = []
+        beg = 0
+        while beg < L:
+            end = beg + max(self._longestMatch(e, beg), 1)
+            if end < L:
+                lbreak.append([s[end], end - beg])
+            lss.append(s[beg:end])
+            if minScore is not None and (L-len(lss)+1)/L < minScore:
+                return None
+            beg = end
+        score = (L-len(lss)+1)/L
+        return [score,lbreak,lss]
+
+    def evaluateThreshold(self, s, threshold):
+        '''
+        :param s: the sequence for which the covering similarirty will be evaluated
+        :param threshold: the score to be reached
+        :return: [passed, lo, hi], passed being True if the covering similarity of s is at least threshold, and
+        [lo, hi] the bounds on the score known when the decision was taken: the segments are matched one after the
+        other from the root, and the evaluation stops as soon as the k segments covering s[:beg] decide it, the
+        L-beg remaining symbols needing between 1 and L-beg more segments
+        '''
+        L = len(s)
+        if L==0:
+            return [1 >= threshold, 1, 1]
+        e = self._encode(s)
+        k = 0
+        beg = 0
+        while True:
+            r = L - beg
+            hi = (L - k - (1 if r else 0) + 1) / L
+            lo = (L - k - r + 1) / L
+            if hi < threshold:
+                return [False, lo, hi]
+            if lo >= threshold:
+                return [True, lo, hi]
+            beg += max(self._longestMatch(e, beg), 1)
+            k += 1
+
+    def evaluateApprox(self, s, epsilon=0.05, confidence=0.95, seed=None):
+        '''
+        :param s: the sequence for which the covering similarirty will be evaluated
+        :param epsilon: tolerated error on the score
+        :param confidence: probability that the error is at most epsilon
+        :param seed: optional seed of the sampling of the blocks
+        :return: [score, halfwidth], the covering similarity of s being in [score - halfwidth, score + halfwidth] with
+        the given confidence. s is cut into blocks of ceil(2/epsilon) symbols, whose greedy coverings have between K
+        and K+nBlocks-1 segments altogether, K being the number of segments of the covering of s; only a random sample
+        of the blocks is covered, and the total is extrapolated (Hoeffding bound). When s is too short for the
+        sample to save work, the exact score is returned with a halfwidth of 0.
+        '''
+        L = len(s)
+        if L==0:
+            return [1, 0]
+        delta = 1 - confidence
+        B = int(math.ceil(2 / epsilon))
+        m = int(math.ceil(2 * math.log(2 / delta) / epsilon ** 2))
+        nf = L // B  # number of full blocks
+        if nf <= m:
+            return [(L - self._segments(self._encode(s)) + 1) / L, 0]
+        rng = random.Random(seed)
+        ksum = sum(self._segments(self._encode(s[b * B:(b + 1) * B])) for b in rng.sample(range(nf), m))
+        rest = self._segments(self._encode(s[nf * B:])) if L > nf * B else 0
+        nb = nf + (1 if rest else 0)
+        K = ksum * nf / m + rest - (nb - 1) / 2
+        halfwidth = (nb - 1) / (2 * L) + nf * (B - 1) / L * math.sqrt(math.log(2 / delta) / (2 * m))
+        return [(L - K + 1) / L, halfwidth]
+
+    def _segments(self, e):
+        """Helper method that returns the number of segments of the greedy covering of the encoded sequence e."""
+        k = 0
+        beg = 0
+        while beg < len(e):
+            beg += max(self._longestMatch(e, beg), 1)
+            k += 1
+        return k
+
+    def evaluateArrays(self, s, occurrences='first'):
+        '''
+        :param s: the sequence for which the covering similarirty will be evaluated
+        :param occurrences: 'first' to locate one occurrence of each segment, 'all' to locate all of them, None to
+        skip the locations
+        :return: the covering of evaluateLinear (same score and segments) as a dict of NumPy arrays instead of lists:
+        'score', 'starts' and 'ends' the offsets of the segments in s, 'ms' the matching statistics of s (longest
+        match at each position). With occurrences='first', 'seq' and 'offset' give the sequence index and the offset
+        in this sequence of one occurrence of each segment (-1 for an unmatched symbol); with occurrences='all', they
+        hold all the occurrences, segment by segment, 'segment' being the index of the segment of each one. The
+        occurrences are mapped to the sequences in bulk by a search over begs, instead of one getSeqId per occurrence.
+        '''
+        if occurrences not in ('first', 'all', None):
+            raise ValueError("occurrences should be 'first', 'all' or None")
+        e = self._encode(s)
+        L = len(e)
+        ms = np.asarray(self.matchingStatistics(e) if L else [], dtype=np.int64)
+        starts = []
+        beg = 0
+        while beg < L:
+            starts.append(beg)
+            beg += max(int(ms[beg]), 1)
+        starts = np.array(starts, dtype=np.int64)
+        ends = np.append(starts[1:], L) if L else starts
+        out = {'score': (L - len(starts) + 1) / L if L else 1, 'starts': starts, 'ends': ends, 'ms': ms}
+        if occurrences is None:
+            return out
+        matched = (ms[starts] > 0).tolist()
+        if occurrences == 'first':
+            segment = np.arange(len(starts))
+            positions = [self.find(e, b, t) if m else -1
+                         for b, t, m in zip(starts.tolist(), ends.tolist(), matched)]
+        else:
+            counts = []
+            positions = []
+            for b, t, m in zip(starts.tolist(), ends.tolist(), matched):
+                ps = self.find_all(e, b, t) if m else []
+                counts.append(len(ps))
+                positions.extend(ps)
+            segment = np.repeat(np.arange(len(starts)), counts)
+            out['segment'] = segment
+        positions = np.asarray(positions, dtype=np.int64)
+        begs = np.asarray(self.begs, dtype=np.int64)
+        seq = np.searchsorted(begs, positions, side='right') - 1
+        offset = positions - begs[np.maximum(seq, 0)]
+        missing = positions < 0
+        seq[missing] = -1
+        offset[missing] = -1
+        out['seq'] = seq
+        out['offset'] = offset
+        return out
+
+    def evaluateWeighted(self, s):
+        '''
+        :param s: the sequence for which the covering similarirty will be evaluated
+        :return: [score, lbreak, lss], lbreak and lss being those of evaluateDichotomic, and score the covering
+        similarity weighted by the rarity of the segments, as in TF-IDF: a segment of length l occurring in df of the N
+        sequences counts for (l-1)*log((N+1)/df)/log(N+1) instead of l-1, the score being (1 + sum over the
+        segments)/L. The document frequencies are read on the nodes reached by the segments, at no extra traversal
+        cost. With a single sequence, the score is the one of evaluateDichotomic.
+        '''
+        L = len(s)
+        if L==0:
+            return [1,[],[]]
+        e = self._encode(s)
+        N = len(self.begs) - len(self.removed)
+        lbreak = []
+        lss = []
+        weight = 1.0
+        beg = 0
+        while beg < L:
+            m, df = self._matchFreq(e, beg)
+            end = beg + max(m, 1)
+            if m > 1:
+                weight += (m - 1) * math.log((N + 1) / df) / math.log(N + 1)
+            if end < L:
+                lbreak.append([s[end], end - beg])
+            lss.append(s[beg:end])
+            beg = end
+        return [weight / L, lbreak, lss]
+
     def evaluateSimple(self, s):
         '''
         :param s: the sequence for which the covering similarirty will be evaluated
@@ -339,12 +1328,13 @@ class STree4CS():
         L = len(s)
         if L==0:
             return [1,[],[]]
+        e = self._query(s)
         lbreak = []
         lss = []
         beg = 0
         while beg < L:
             end = beg + 1
-            while end <= L and self.find(s[beg:end]) >= 0:
+            while end <= L and self.find(e, beg, end) >= 0:
                 end += 1
             # print(beg,end,end='||')
             beg0 = end
@@ -359,6 +1349,162 @@ class STree4CS():
         score = (L - len(lbreak)) / L
         return [score, lbreak, lss]
 
+    def evaluatePerSequence(self, s, seqIdxs=None):
+        '''
+        :param s: the sequence for which the covering similarirty will be evaluated
+        :param seqIdxs: Optional: List of indexes of sequences, all the sequences (not removed) by default
+        :return: dict sequence index -> covering similarity of s by this sequence alone, i.e. the score of
+        evaluateLinear on the suffix tree of this sequence. All the sequences are evaluated in one pass over s: the
+        sequences whose coverings have a segment starting at the same position of s are matched together from the
+        root, and leave the match where the labels of the nodes (see _label_generalized) stop containing them.
+        '''
+        if seqIdxs is None:
+            seqIdxs = [i for i in range(len(self.begs)) if i not in self.removed]
+        L = len(s)
+        if L==0:
+            return {i: 1 for i in seqIdxs}
+        e = self._encode(s)
+        groups = {0: {0: self._mask(seqIdxs)}}  # start of a segment -> {number of segments before: bitset}
+        starts = [0]
+        done = {}  # number of segments of the whole covering -> bitset
+        while starts:
+            beg = heapq.heappop(starts)
+            byCount = groups.pop(beg)
+            mask = 0
+            for m in byCount.values():
+                mask |= m
+            for d, bits in self._breaks(e, beg, mask):
+                end = beg + max(d, 1)
+                if end >= L:
+                    target = done
+                elif end in groups:
+                    target = groups[end]
+                else:
+                    target = groups[end] = {}
+                    heapq.heappush(starts, end)
+                for c, m in byCount.items():
+                    if m & bits:
+                        target[c + 1] = target.get(c + 1, 0) | (m & bits)
+        scores = {}
+        for c, m in done.items():
+            for i in _bits(m):
+                scores[i] = (L-c+1)/L
+        return scores
+
+    def topk(self, s, k=1, seqIdxs=None):
+        '''
+        :param s: the query sequence
+        :param k: number of sequences returned
+        :return: the list of the k (sequence index, covering similarity) pairs of the sequences covering s best, by
+        decreasing similarity (see evaluatePerSequence)
+        '''
+        scores = self.evaluatePerSequence(s, seqIdxs)
+        return sorted(scores.items(), key=lambda p: (-p[1], p[0]))[:k]
+
+    def _breaks(self, s, beg, mask):
+        """Helper generator of the (d, bits) pairs such that the longest prefix of s[beg:] found in the sequences of
+        the bitset bits, among those of mask, has length d."""
+        self._ensure_labeled()
+        word = self.word
+        L = len(s)
+        node = self.root
+        d = 0
+        while mask:
+            if beg + d == L:
+                yield d, mask
+                return
+            child = node._get_transition_link(s[beg + d])
+            inside = self._labels(child) & mask if child else 0
+            if mask & ~inside:
+                yield d, mask & ~inside
+            mask = inside
+            if not mask:
+                return
+            d += 1
+            while d < child.depth and beg + d < L and word[child.idx + d] == s[beg + d]:
+                d += 1
+            if d < child.depth:
+                yield d, mask
+                return
+            node = child
+
+    def evaluateStream(self, symbols=None, window=None):
+        '''
+        :param symbols: iterable of symbols, possibly unbounded (e.g. a live event stream), consumed lazily
+        :param window: optional number N of symbols, to maintain the covering similarity of the last N symbols
+        :return: a CoveringStream, which yields the (segment, lbreak) pairs of the covering of the stream as soon as
+        the segments are closed, and exposes the running score and windowScore; symbols can also be pushed one at a
+        time with its push() method
+        '''
+        from .Stream4CS import CoveringStream
+        return CoveringStream(self, symbols, window)
+
+    def _match_start(self):
+        """Helper method that returns the match state of the empty segment, for CoveringStream."""
+        return (self.root, 0)
+
+    def _match_step(self, state, c):
+        """Helper method that extends the match state of a segment with the symbol c.
+
+        :return: the new state, a (node, d) pair where d is the length of the segment and node the node ending the
+                 edge holding its end, or None if the extended segment is not found
+        """
+        node, d = state
+        c = self._code(c)
+        if d == node.depth:
+            child = node._get_transition_link(c)
+            if not child or self._is_removed(child):
+                return None
+            return (child, d + 1)
+        if self.word[node.idx + d] != c:
+            return None
+        return (node, d + 1)
+
+    def evaluate_many(self, queries, method='dichotomic', n_jobs=1, chunksize=64, **kwargs):
+        '''
+        :param queries: iterable of sequences for which the covering similarity will be evaluated, consumed lazily
+        :param method: 'dichotomic' (evaluateDichotomic), 'simple' (evaluateSimple), 'linear' (evaluateLinear),
+        'weighted' (evaluateWeighted), 'threshold' (evaluateThreshold) or 'approx' (evaluateApprox)
+        :param n_jobs: number of worker processes sharing the tree (see parallel.imap_shared), None or -1 for all the
+        cores, 1 to evaluate in the calling process
+        :param chunksize: number of queries sent at once to a worker process
+        :param kwargs: passed to the evaluation method, e.g. threshold=0.8 for 'threshold'
+        :return: generator of the evaluations ([score, lbreak, lss] for the exact methods), in the order of the queries
+        '''
+        if method not in _EVALUATORS:
+            raise ValueError("method should be one of " + ", ".join(sorted(_EVALUATORS)))
+        tasks = _chunks(queries, (method, kwargs), chunksize)
+        return (r for chunk in imap_shared(self, _evaluate_chunk, tasks, n_jobs) for r in chunk)
+
+    def enable_stats(self, callback=None):
+        '''
+        Instruments the index: from now on, the calls of its hot-path methods (build phases, find, lookups of the
+        evaluations, ...) are counted and timed, together with the transition lookups, node visits and suffix links
+        followed, the symbols of the text compared and the segments produced. Without it, the index runs the plain
+        code, at no cost. Only the calls made in the calling process are counted (not those of evaluate_many workers).
+
+        :param callback: optional function called after each evaluation as callback(method, stats), stats being the
+        dict {'counts': {...}, 'times': {...}} of this evaluation alone
+        :return: the Stats4CS of the index, whose as_dict() returns the counts and times accumulated so far
+        '''
+        from .Stats4CS import Stats4CS
+        self.disable_stats()
+        self.stats = Stats4CS(self, callback)
+        self.stats.install()
+        return self.stats
+
+    def disable_stats(self):
+        '''
+        Removes the instrumentation of the index.
+
+        :return: the dict of the counts and times accumulated, None if the index was not instrumented
+        '''
+        stats = self.__dict__.pop('stats', None)
+        if stats is None:
+            return None
+        stats.uninstall()
+        return stats.as_dict()
+
     def getSeqId(self, n):
         '''
         :param n: a sequence index (time-stamp): in the generalized suffix tree, the sequences of the input set S are
@@ -388,18 +1534,148 @@ class STree4CS():
         return tb, n - lb[tb]
 
 
+_EVALUATORS = {'dichotomic': 'evaluateDichotomic', 'simple': 'evaluateSimple', 'linear': 'evaluateLinear',
+               'weighted': 'evaluateWeighted', 'threshold': 'evaluateThreshold', 'approx': 'evaluateApprox',
+               'arrays': 'evaluateArrays'}
+
+
+def _chunks(queries, head, chunksize):
+    """Helper generator that groups the queries into (head, chunk) tasks, head being what the workers need besides
+    the queries (e.g. the method and its arguments)."""
+    queries = iter(queries)
+    while True:
+        chunk = list(islice(queries, chunksize))
+        if not chunk:
+            return
+        yield head, chunk
+
+
+def _unpickle_tree(cls, state, arrays, nodeStore, cacheSize):
+    """Helper function that rebuilds a tree pickled by STree4CS.__reduce_ex__."""
+    st = object.__new__(cls)
+    st.__dict__.update(state)
+    st._unpack_index_arrays(arrays, nodeStore)
+    st._cache = _LocusCache(cacheSize) if cacheSize is not None else None
+    if st.removed:
+        st._ensure_labeled()
+    return st
+
+
+def _evaluate_chunk(st, task):
+    (method, kwargs), chunk = task
+    evaluate = getattr(st, _EVALUATORS[method])
+    return [evaluate(s, **kwargs) for s in chunk]
+
+
+def _bits(mask):
+    """Helper generator of the indexes of the bits set in mask, in increasing order."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class _LocusCache():
+    """LRU cache of the loci (node or None) of query fragments, keyed by their length and a polynomial hash of their
+    codes modulo the prime 2**61-1 (so that the keys take a constant space, two distinct fragments of the same
+    length colliding with a probability of about 2**-61). The prefix hashes of the query being evaluated are kept, so
+    that the key of any of its fragments is computed in constant time."""
+
+    MODULUS = (1 << 61) - 1
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.resumed = 0
+        self.base = random.randrange(1 << 32, self.MODULUS - 1)
+        self.powers = [1]  # powers of base
+        self.query = None  # _Codes query whose prefix hashes are kept
+        self.prefix = None
+        self.hint = None  # (query, start, length, locus, failed) of the longest prefix of the fragment matched last
+
+    def key(self, y, start, stop):
+        """Returns the key of the fragment y[start:stop]."""
+        n = stop - start
+        if y is self.query and n < len(self.powers):
+            return n, (self.prefix[stop] - self.prefix[start] * self.powers[n]) % self.MODULUS
+        M = self.MODULUS
+        B = self.base
+        if not isinstance(y, _Codes):
+            # the query may be modified by the caller: its hashes are not kept
+            h = 0
+            for c in y[start:stop]:
+                h = (h * B + int(c)) % M
+            return n, h
+        if y is not self.query:
+            prefix = [0]
+            h = 0
+            for c in y:
+                h = (h * B + int(c)) % M
+                prefix.append(h)
+            self.query = y
+            self.prefix = prefix
+        powers = self.powers
+        while len(powers) <= n:
+            powers.append(powers[-1] * B % M)
+        return n, (self.prefix[stop] - self.prefix[start] * powers[n]) % M
+
+    def get(self, key):
+        """Returns (True, locus) if key is cached, (False, None) otherwise."""
+        items = self.items
+        if key in items:
+            self.hits += 1
+            items.move_to_end(key)
+            return True, items[key]
+        self.misses += 1
+        return False, None
+
+    def peek(self, key):
+        """Same as get, without counting a hit or a miss."""
+        try:
+            locus = self.items[key]
+        except KeyError:
+            return False, None
+        self.items.move_to_end(key)
+        return True, locus
+
+    def put(self, key, locus):
+        self.items[key] = locus
+        self.items.move_to_end(key)
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+        self.hint = None
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'resumed': self.resumed, 'size': len(self.items),
+                'maxsize': self.maxsize}
+
+
+class _Codes(list):
+    """List of the codes of the symbols of a query (see STree4CS._encode)."""
+
+
 class _SNode():
     """Class representing a Node in the Suffix tree."""
 
+    __slots__ = ('_suffix_link', 'transition_links', 'idx', 'depth', 'parent', 'generalized_idxs', 'leaf_count',
+                 'seq_count')
+
     def __init__(self, idx=-1, parentNode=None, depth=-1):
         # Links
         self._suffix_link = None
-        self.transition_links = []
+        self.transition_links = {}  # symbol -> child node
         # Properties
         self.idx = idx
         self.depth = depth
         self.parent = parentNode
-        self.generalized_idxs = {}
+        self.generalized_idxs = 0  # bitset of the indexes of sequences below the node, see _label_generalized
+        self.leaf_count = 0  # number of occurrences below the node, see _count_node
+        self.seq_count = 0  # number of distinct sequences below the node
 
     def __str__(self):
         return ("SNode: idx:" + str(self.idx) + " depth:" + str(self.depth) +
@@ -415,33 +1691,271 @@ class _SNode():
             return False
 
     def _get_transition_link(self, suffix):
-        for node, _suffix in self.transition_links:
-            if _suffix == '__@__' or suffix == _suffix:
-                return node
-        return False
+        return self.transition_links.get(suffix, False)
 
     def _add_transition_link(self, snode, suffix=''):
-        tl = self._get_transition_link(suffix)
-        if tl:  # TODO: imporve this.
-            self.transition_links.remove((tl, suffix))
-        self.transition_links.append((snode, suffix))
+        self.transition_links[suffix] = snode
 
     def _has_transition(self, suffix):
-        for node, _suffix in self.transition_links:
-            if _suffix == '__@__' or suffix == _suffix:
-                return True
-        return False
+        return suffix in self.transition_links
 
     def is_leaf(self):
-        return self.transition_links == []
+        return not self.transition_links
 
     def _traverse(self, f):
-        for (node, _) in self.transition_links:
-            node._traverse(f)
-        f(self)
+        """Applies f to the nodes of the subtree in post-order, without recursion."""
+        stack = [(self, False)]
+        while stack:
+            node, visited = stack.pop()
+            if visited:
+                f(node)
+            else:
+                stack.append((node, True))
+                stack.extend((n, False) for n in reversed(list(node.transition_links.values())))
 
     def _get_leaves(self):
-        if self.is_leaf():
-            return [self]
+        leaves = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf():
+                leaves.append(node)
+            else:
+                stack.extend(reversed(list(node.transition_links.values())))
+        return leaves
+
+
+class _NodeStore():
+    """Flat storage of the nodes of a suffix tree, addressed by integer ids.
+    Node properties are kept in typed arrays and the children in sorted CSR arrays (child_ptr, child_sym, child_id)
+    searched by bisection, so that a node only costs a few machine words. The children set since the arrays were last
+    packed (while the tree is built or updated) are kept in an overlay dict, node id -> {symbol: child id}, which takes
+    precedence over the arrays, so that an update never unpacks them. Symbols must be integers.
+    """
+
+    def __init__(self):
+        self.idx = array('q')
+        self.depth = array('q')
+        self.parent = array('q')
+        self.slink = array('q')
+        self.generalized_idxs = {}
+        self.leaf_count = {}
+        self.seq_count = {}
+        self._children = {}  # overlay of the children set since the last freeze
+        self.child_ptr = array('q', [0])
+        self.child_sym = array('q')
+        self.child_id = array('q')
+
+    def __len__(self):
+        return len(self.idx)
+
+    @staticmethod
+    def from_arrays(arrays):
+        """Returns a (modifiable) store holding the nodes of the arrays idx, depth, parent, slink, child_ptr, child_sym
+        and child_id, as written by STree4CS._index_arrays."""
+        store = _NodeStore()
+        for name in ('idx', 'depth', 'parent', 'slink', 'child_ptr', 'child_sym', 'child_id'):
+            column = array('q')
+            column.frombytes(np.asarray(arrays[name], dtype=np.int64).tobytes())
+            setattr(store, name, column)
+        return store
+
+    def new_node(self, idx=-1, depth=-1):
+        self.idx.append(idx)
+        self.depth.append(depth)
+        self.parent.append(-1)
+        self.slink.append(-1)
+        return _SNodeRef(self, len(self.idx) - 1)
+
+    def get_child(self, u, symbol):
+        """Returns the id of the child of node u along symbol, -1 if there is none."""
+        if self._children:
+            extra = self._children.get(u)
+            if extra is not None and symbol in extra:
+                return extra[symbol]
+        ptr = self.child_ptr
+        if u + 1 >= len(ptr):
+            return -1
+        hi = ptr[u + 1]
+        i = bisect_left(self.child_sym, symbol, ptr[u], hi)
+        if i < hi and self.child_sym[i] == symbol:
+            return self.child_id[i]
+        return -1
+
+    def set_child(self, u, symbol, v):
+        extra = self._children.get(u)
+        if extra is None:
+            extra = self._children[u] = {}
+        extra[symbol] = v
+
+    def children(self, u):
+        """Returns the list of (symbol, child id) of node u, by increasing symbol."""
+        if u + 1 < len(self.child_ptr):
+            lo = self.child_ptr[u]
+            hi = self.child_ptr[u + 1]
+            items = list(zip(self.child_sym[lo:hi], self.child_id[lo:hi]))
         else:
-            return [x for (n, _) in self.transition_links for x in n._get_leaves()]
+            items = []
+        extra = self._children.get(u)
+        if extra is not None:
+            merged = dict(items)
+            merged.update(extra)
+            items = sorted(merged.items())
+        return items
+
+    def is_leaf(self, u):
+        if self._children and u in self._children:
+            return False
+        ptr = self.child_ptr
+        return u + 1 >= len(ptr) or ptr[u] == ptr[u + 1]
+
+    def freeze(self, ratio=0):
+        """Packs the overlay into the CSR arrays, with vectorized passes.
+
+        :param ratio: the overlay is only packed if it holds the children of at least ratio * len(self) nodes, so
+        that the cost of packing is amortized over the updates
+        """
+        if not self._children or len(self._children) < ratio * len(self):
+            return
+        ptr = np.asarray(self.child_ptr, dtype=np.int64)
+        owner = [np.repeat(np.arange(len(ptr) - 1, dtype=np.int64), np.diff(ptr))]
+        sym = [np.asarray(self.child_sym, dtype=np.int64)]
+        cid = [np.asarray(self.child_id, dtype=np.int64)]
+        for u, extra in self._children.items():
+            owner.append(np.full(len(extra), u, dtype=np.int64))
+            sym.append(np.fromiter(extra.keys(), dtype=np.int64, count=len(extra)))
+            cid.append(np.fromiter(extra.values(), dtype=np.int64, count=len(extra)))
+        first = len(owner[0])
+        owner = np.concatenate(owner)
+        sym = np.concatenate(sym)
+        cid = np.concatenate(cid)
+        # sort by node and symbol, the overlay after the arrays, and keep the last child of each (node, symbol)
+        order = np.lexsort((np.arange(len(owner)) >= first, sym, owner))
+        owner = owner[order]
+        sym = sym[order]
+        cid = cid[order]
+        last = np.ones(len(owner), dtype=bool)
+        last[:-1] = (owner[1:] != owner[:-1]) | (sym[1:] != sym[:-1])
+        counts = np.bincount(owner[last], minlength=len(self))
+        columns = {'child_ptr': np.concatenate(([0], np.cumsum(counts))), 'child_sym': sym[last],
+                   'child_id': cid[last]}
+        for name, a in columns.items():
+            column = array('q')
+            column.frombytes(a.astype(np.int64).tobytes())
+            setattr(self, name, column)
+        self._children = {}
+
+
+class _MappedWord():
+    """Read-only view of a (memory-mapped) NumPy word, slices being returned as lists like those of the built word."""
+
+    def __init__(self, array):
+        self.array = array
+        self._view = memoryview(array)
+
+    def __len__(self):
+        return len(self._view)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._view[i].tolist()
+        return self._view[i]
+
+    def __iter__(self):
+        return iter(self._view)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.array, dtype=dtype)
+
+
+class _SNodeRef():
+    """Lightweight handle on a node of a _NodeStore, exposing the same interface as _SNode."""
+
+    __slots__ = ('store', 'id')
+
+    def __init__(self, store, id):
+        self.store = store
+        self.id = id
+
+    def __eq__(self, other):
+        return isinstance(other, _SNodeRef) and other.id == self.id and other.store is self.store
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def _ref(self, id):
+        return _SNodeRef(self.store, id) if id >= 0 else None
+
+    @property
+    def idx(self):
+        return self.store.idx[self.id]
+
+    @idx.setter
+    def idx(self, value):
+        self.store.idx[self.id] = value
+
+    @property
+    def depth(self):
+        return self.store.depth[self.id]
+
+    @depth.setter
+    def depth(self, value):
+        self.store.depth[self.id] = value
+
+    @property
+    def parent(self):
+        return self._ref(self.store.parent[self.id])
+
+    @parent.setter
+    def parent(self, node):
+        self.store.parent[self.id] = node.id
+
+    @property
+    def generalized_idxs(self):
+        return self.store.generalized_idxs.get(self.id, 0)
+
+    @generalized_idxs.setter
+    def generalized_idxs(self, value):
+        self.store.generalized_idxs[self.id] = value
+
+    @property
+    def leaf_count(self):
+        return self.store.leaf_count.get(self.id, 0)
+
+    @leaf_count.setter
+    def leaf_count(self, value):
+        self.store.leaf_count[self.id] = value
+
+    @property
+    def seq_count(self):
+        return self.store.seq_count.get(self.id, 0)
+
+    @seq_count.setter
+    def seq_count(self, value):
+        self.store.seq_count[self.id] = value
+
+    @property
+    def transition_links(self):
+        return {s: _SNodeRef(self.store, v) for s, v in self.store.children(self.id)}
+
+    def _add_suffix_link(self, snode):
+        self.store.slink[self.id] = snode.id
+
+    def _get_suffix_link(self):
+        return self._ref(self.store.slink[self.id]) or False
+
+    def _get_transition_link(self, suffix):
+        return self._ref(self.store.get_child(self.id, suffix)) or False
+
+    def _add_transition_link(self, snode, suffix=''):
+        self.store.set_child(self.id, suffix, snode.id)
+
+    def _has_transition(self, suffix):
+        return self.store.get_child(self.id, suffix) >= 0
+
+    def is_leaf(self):
+        return self.store.is_leaf(self.id)
+
+    __str__ = _SNode.__str__
+    _traverse = _SNode._traverse
+    _get_leaves = _SNode._get_leaves
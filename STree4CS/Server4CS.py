@@ -0,0 +1,327 @@
+'''
+Asynchronous scoring service over a built or memory-mapped index: the concurrent evaluate() requests are coalesced
+into micro-batches, which are evaluated by a pool of workers holding the index, so that the event loop is never
+blocked by a long query. Each request has a deadline, and the latencies and throughput are measured.
+
+The service is also exposed by a small local HTTP server, on an index saved with STree4CS.save():
+
+$ python3 -m STree4CS.Server4CS S.idx --port 8000 --n_jobs 4
+$ curl -d '{"query": [1, 1, 5, 7, 5, 1, 7, 4]}' localhost:8000/evaluate
+$ curl localhost:8000/metrics
+'''
+import sys
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .STree4CS import STree4CS, _EVALUATORS
+from .parallel import n_workers, _init_worker, _call
+
+
+def _evaluate_batch(st, batch):
+    '''
+    :param batch: list of (method, kwargs, query) requests
+    :return: the list of their (True, evaluation) or (False, exception) outcomes
+    '''
+    out = []
+    for method, kwargs, s in batch:
+        try:
+            out.append((True, getattr(st, _EVALUATORS[method])(s, **kwargs)))
+        except Exception as e:
+            out.append((False, e))
+    return out
+
+
+def _percentile(values, q):
+    """Returns the q-th percentile (0 <= q <= 100) of the sorted list values, by the nearest rank."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q / 100.0 * len(values)))]
+
+
+class CoveringService():
+    """Class representing an asynchronous covering evaluation service over one index."""
+
+    def __init__(self, index, method='dichotomic', n_jobs=1, max_batch=64, max_delay=0.002, timeout=None,
+                 window=10000):
+        '''
+        :param index: the STree4CS (SArray4CS, Sharded4CS) index, or the path of an index saved with STree4CS.save(),
+        which is then memory-mapped
+        :param method: default evaluation method, see STree4CS.evaluate_many
+        :param n_jobs: number of worker processes holding the index, None or -1 for all the cores; with 1 the
+        batches are evaluated by a thread of the calling process
+        :param max_batch: maximum number of requests per batch
+        :param max_delay: seconds a batch waits for more requests once a worker is free, when there are fewer than
+        max_batch requests pending
+        :param timeout: default deadline of the requests, in seconds, None for no deadline
+        :param window: number of the last latencies kept for the percentiles of metrics()
+        '''
+        if isinstance(index, str):
+            index = STree4CS.load(index, mmap=True)
+        if method not in _EVALUATORS:
+            raise ValueError("method should be one of " + ", ".join(sorted(_EVALUATORS)))
+        self.index = index
+        self.method = method
+        self.n_jobs = n_workers(n_jobs)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.counts = {'requests': 0, 'completed': 0, 'timeouts': 0, 'errors': 0, 'batches': 0, 'batched': 0}
+        self.latencies = deque(maxlen=window)  # seconds, of the last completed requests
+        self._queue = None
+        self._slots = None
+        self._executor = None
+        self._batcher = None
+        self._running = set()
+        self._started = None
+
+    async def start(self):
+        """Starts the worker pool and the batching task."""
+        if self._batcher is not None:
+            return
+        if self.n_jobs == 1:
+            self._executor = ThreadPoolExecutor(1)
+        else:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')  # the workers inherit the index
+            else:
+                context = multiprocessing.get_context()
+            self._executor = ProcessPoolExecutor(self.n_jobs, mp_context=context, initializer=_init_worker,
+                                                 initargs=(self.index,))
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.n_jobs)
+        self._started = time.perf_counter()
+        self._batcher = asyncio.get_running_loop().create_task(self._batches())
+
+    async def close(self):
+        """Stops the batching task and the worker pool, the pending requests being cancelled."""
+        if self._batcher is None:
+            return
+        self._batcher.cancel()
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(self._batcher, *self._running, return_exceptions=True)
+        while not self._queue.empty():
+            self._queue.get_nowait()[3].cancel()
+        self._executor.shutdown(wait=False)  # the pending evaluations were cancelled with their tasks
+        self._batcher = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def evaluate(self, s, method=None, timeout=-1, **kwargs):
+        '''
+        :param s: the sequence for which the covering similarity will be evaluated
+        :param method: evaluation method (see STree4CS.evaluate_many), the one of the service by default
+        :param timeout: deadline of the request in seconds, None for no deadline, the one of the service by default
+        :param kwargs: passed to the evaluation method, e.g. threshold=0.8 for 'threshold'
+        :return: the evaluation of s, e.g. [score, lbreak, lss]; raises asyncio.TimeoutError when the deadline is
+        missed (the request is then dropped if it has not been sent to a worker yet)
+        '''
+        if method is None:
+            method = self.method
+        if method not in _EVALUATORS:
+            raise ValueError("method should be one of " + ", ".join(sorted(_EVALUATORS)))
+        if timeout == -1:
+            timeout = self.timeout
+        if self._batcher is None:
+            await self.start()
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        future = loop.create_future()
+        deadline = None if timeout is None else loop.time() + timeout
+        self.counts['requests'] += 1
+        self._queue.put_nowait((method, kwargs, s, future, deadline))
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.counts['timeouts'] += 1
+            raise
+        except Exception:
+            self.counts['errors'] += 1
+            raise
+        self.counts['completed'] += 1
+        self.latencies.append(time.perf_counter() - t0)
+        return result
+
+    async def _batches(self):
+        """Task that gathers the pending requests into batches, as soon as a worker is free."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            await self._slots.acquire()
+            # the requests that arrived while all the workers were busy join the batch at once
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            end = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                wait = end - loop.time()
+                if wait <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), wait))
+                except asyncio.TimeoutError:
+                    break
+            now = loop.time()
+            batch = [r for r in batch if not r[3].done() and (r[4] is None or r[4] > now)]
+            if not batch:
+                self._slots.release()
+                continue
+            task = loop.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        """Task that evaluates one batch in the worker pool and resolves the futures of its requests."""
+        loop = asyncio.get_running_loop()
+        requests = [(method, kwargs, s) for method, kwargs, s, future, deadline in batch]
+        try:
+            if self.n_jobs == 1:
+                outcomes = await loop.run_in_executor(self._executor, _evaluate_batch, self.index, requests)
+            else:
+                outcomes = await loop.run_in_executor(self._executor, _call, _evaluate_batch, requests)
+        except Exception as e:
+            outcomes = [(False, e)] * len(batch)
+        finally:
+            self._slots.release()
+        self.counts['batches'] += 1
+        self.counts['batched'] += len(batch)
+        for r, (ok, result) in zip(batch, outcomes):
+            future = r[3]
+            if future.done():
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def metrics(self):
+        '''
+        :return: dict of the request counts, of the mean batch size, of the throughput (completed requests per second
+        since the start) and of the latency percentiles (seconds, over the last completed requests)
+        '''
+        counts = self.counts
+        latencies = sorted(self.latencies)
+        elapsed = time.perf_counter() - self._started if self._started is not None else 0
+        m = dict(counts)
+        m['pending'] = self._queue.qsize() if self._queue is not None else 0
+        m['mean_batch'] = counts['batched'] / counts['batches'] if counts['batches'] else 0
+        m['throughput'] = counts['completed'] / elapsed if elapsed > 0 else 0
+        m['latency'] = {'mean': sum(latencies) / len(latencies) if latencies else None,
+                        'p50': _percentile(latencies, 50), 'p90': _percentile(latencies, 90),
+                        'p99': _percentile(latencies, 99), 'max': latencies[-1] if latencies else None}
+        return m
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error', 504: 'Gateway Timeout'}
+
+
+async def _route(service, verb, target, body):
+    '''
+    :return: the (status, JSON payload) of an HTTP request: POST /evaluate with a JSON body {"query": [...]} or
+    {"queries": [[...], ...]}, and optional "method", "timeout" and "kwargs" (arguments of the method); GET /metrics
+    '''
+    path = target.split('?')[0]
+    if verb == 'GET' and path == '/metrics':
+        return 200, service.metrics()
+    if verb != 'POST' or path != '/evaluate':
+        return 404, {'error': 'unknown endpoint ' + verb + ' ' + path}
+    try:
+        request = json.loads(body.decode('utf-8'))
+        options = {'method': request.get('method'), 'timeout': request.get('timeout', -1)}
+        options.update(request.get('kwargs', {}))
+        if 'queries' in request:
+            results = await asyncio.gather(*[service.evaluate(s, **options) for s in request['queries']])
+            return 200, {'results': results}
+        return 200, {'result': await service.evaluate(request['query'], **options)}
+    except asyncio.TimeoutError:
+        return 504, {'error': 'deadline exceeded'}
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return 400, {'error': str(e)}
+    except Exception as e:
+        return 500, {'error': str(e)}
+
+
+def _jsonable(x):
+    """Helper function that converts the NumPy results (e.g. of evaluateArrays) for json.dumps."""
+    if isinstance(x, (np.ndarray, np.generic)):
+        return x.tolist()
+    raise TypeError(type(x).__name__ + " is not JSON serializable")
+
+
+async def _handle(service, reader, writer):
+    """Serves the HTTP/1.1 requests of one connection, which is kept alive unless the client closes it."""
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            verb, target, version = line.decode('latin-1').split()
+            headers = {}
+            while True:
+                header = await reader.readline()
+                if header in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = header.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            status, payload = await _route(service, verb, target, body)
+            data = json.dumps(payload, default=_jsonable).encode('utf-8')
+            writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                          % (status, _REASONS[status], len(data))).encode('latin-1') + data)
+            await writer.drain()
+            if headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0':
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service, host='127.0.0.1', port=8000):
+    '''
+    :param service: the CoveringService answering the requests
+    :return: the asyncio server, listening on host:port (see _route for the endpoints)
+    '''
+    await service.start()
+    return await asyncio.start_server(lambda reader, writer: _handle(service, reader, writer), host, port)
+
+
+async def _serve_forever(args):
+    async with CoveringService(args.index, args.method, args.n_jobs, args.max_batch, args.max_delay,
+                               args.timeout) as service:
+        server = await serve(service, args.host, args.port)
+        print('serving', args.index, 'on', args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('index', help='directory of an index saved with STree4CS.save()')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--method', default='dichotomic', help='default evaluation method')
+    parser.add_argument('--n_jobs', type=int, default=1, help='worker processes, -1 for all the cores')
+    parser.add_argument('--max_batch', type=int, default=64, help='maximum number of requests per batch')
+    parser.add_argument('--max_delay', type=float, default=0.002, help='seconds a batch waits for more requests')
+    parser.add_argument('--timeout', type=float, default=None, help='default deadline of the requests, in seconds')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve_forever(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
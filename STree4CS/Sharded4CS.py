@@ -0,0 +1,305 @@
+'''
+Sharded generalized index: the input sequences are partitioned across several STree4CS (or SArray4CS) shards, which
+can be held by separate worker processes. Queries combine the answers of the shards, with the same results as a
+single STree4CS built on all the sequences.
+'''
+import multiprocessing
+import numpy as np
+from bisect import bisect_right
+
+from .STree4CS import STree4CS
+
+
+def _shard_server(conn, xs, kwargs):
+    st = STree4CS(xs, **kwargs)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        name, args = request
+        try:
+            conn.send((True, getattr(st, name)(*args)))
+        except Exception as e:
+            conn.send((False, e))
+    conn.close()
+
+
+class _LocalShard():
+    """Shard held by the calling process."""
+
+    def __init__(self, xs, kwargs):
+        self.index = STree4CS(xs, **kwargs)
+        self._result = None
+
+    def send(self, name, *args):
+        self._result = getattr(self.index, name)(*args)
+
+    def recv(self):
+        return self._result
+
+    def close(self):
+        pass
+
+
+class _ProcessShard():
+    """Shard built and held by a worker process, queried through a pipe."""
+
+    def __init__(self, xs, kwargs, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_shard_server, args=(child, xs, kwargs))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+    def send(self, name, *args):
+        self.conn.send((name, args))
+
+    def recv(self):
+        ok, result = self.conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        if self.process.is_alive():
+            self.conn.send(None)
+            self.process.join()
+        self.conn.close()
+
+
+class Sharded4CS(STree4CS):
+    """Class representing a generalized index partitioned into shards, answering the same queries as STree4CS."""
+
+    _backend = 'sharded'
+
+    def __new__(cls, *args, **kwargs):
+        return object.__new__(cls)
+
+    def __init__(self, input='', n_shards=2, processes=False, **kwargs):
+        '''
+        :param input: List of Sequences
+        :param n_shards: number of shards, the sequences being dealt to the least loaded shard
+        :param processes: if True, each shard is built and held by its own worker process, and the shards are queried
+        in parallel
+        :param kwargs: passed to the STree4CS constructor of each shard (e.g. backend='sa')
+        '''
+        self.n_shards = n_shards
+        self.processes = processes
+        self.kwargs = kwargs
+        self.shards = []
+        self.begs = []
+        self.ends = []
+        self.word_starts = []
+        self.shard_of = []  # shard of each sequence
+        self.local_id = []  # index of each sequence in its shard
+        self.removed = set()
+        self.global_ids = []  # global indexes of the sequences of each shard
+        self.local_begs = []  # starting positions of the sequences of each shard, in the shard
+        if isinstance(input, np.ndarray) or not input == '':
+            self.build(input)
+
+    def build(self, xs):
+        """Partitions the sequences and builds the shards.
+
+        :param xs: List of Sequences
+        """
+        if self._check_input(xs) != 'gst':
+            raise ValueError("Sequence argument should be a list of sequences")
+        self._generalized_word_starts(xs)
+        self.begs = list(self.word_starts)
+        self.ends = [b + len(x) for b, x in zip(self.begs, xs)]
+
+        n = max(1, min(self.n_shards, len(xs)))
+        parts = [[] for _ in range(n)]
+        loads = [0] * n
+        self.global_ids = [[] for _ in range(n)]
+        self.local_begs = [[] for _ in range(n)]
+        for i, x in enumerate(xs):
+            j = loads.index(min(loads))
+            self.shard_of.append(j)
+            self.local_id.append(len(parts[j]))
+            self.global_ids[j].append(i)
+            self.local_begs[j].append(loads[j])
+            parts[j].append(x)
+            loads[j] += len(x) + 1
+
+        if self.processes:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+            else:
+                context = multiprocessing.get_context()
+            self.shards = [_ProcessShard(part, self.kwargs, context) for part in parts]
+        else:
+            self.shards = [_LocalShard(part, self.kwargs) for part in parts]
+
+    def close(self):
+        """Stops the worker processes holding the shards."""
+        for shard in self.shards:
+            shard.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_sequence(self, x):
+        raise NotImplementedError("Sharded4CS cannot be updated, build a new one")
+
+    def remove_sequence(self, i):
+        raise NotImplementedError("Sharded4CS cannot be updated, build a new one")
+
+    def enable_cache(self, maxsize=4096):
+        """Enables the cache of the loci of the query fragments in every shard (see STree4CS.enable_cache)."""
+        self._map('enable_cache', maxsize)
+
+    def disable_cache(self):
+        self._map('disable_cache')
+
+    def cache_info(self):
+        infos = [i for i in self._map('cache_info') if i is not None]
+        if not infos:
+            return None
+        return {k: sum(i[k] for i in infos) for k in infos[0]}
+
+    def _encode(self, s):
+        # the queries are encoded by the shards, each one having its own codebook
+        return s
+
+    def _map(self, name, *args):
+        """Helper method that calls the method name of every shard, the shards running in parallel when held by
+        worker processes."""
+        for shard in self.shards:
+            shard.send(name, *args)
+        return self._gather(self.shards)
+
+    def _gather(self, shards):
+        """Helper method that reads the replies of the shards. The reply of every shard is read before the first
+        error is raised, so that the pipes of the worker processes stay in step with the requests."""
+        results, error = [], None
+        for shard in shards:
+            try:
+                results.append(shard.recv())
+            except Exception as e:
+                results.append(None)
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+        return results
+
+    def _call(self, j, name, *args):
+        self.shards[j].send(name, *args)
+        return self.shards[j].recv()
+
+    def _global_position(self, j, p):
+        """Helper method that converts the position p in the shard j into a position in the (virtual) concatenation
+        of all the sequences."""
+        i = bisect_right(self.local_begs[j], p) - 1
+        return self.begs[self.global_ids[j][i]] + p - self.local_begs[j][i]
+
+    def _by_shard(self, seqIdxs):
+        """Helper method that groups global sequence indexes by shard, as local indexes."""
+        groups = {}
+        for i in seqIdxs:
+            groups.setdefault(self.shard_of[i], []).append(self.local_id[i])
+        return groups
+
+    def find(self, y, start=0, stop=None):
+        """Returns starting position of the subsequence y[start:stop] in the (virtual) concatenation of the sequences.
+
+        :param y: Seq
+        :param start: Optional: starting index of the subsequence in y
+        :param stop: Optional: ending index (excluded) of the subsequence in y, len(y) by default
+        :return: Index of the starting position of sequence y, -1 if y is not a subsequence.
+        """
+        stop = len(y) if stop is None else min(stop, len(y))
+        if stop <= start:
+            return 0
+        for j, p in enumerate(self._map('find', y, start, stop)):
+            if p >= 0:
+                return self._global_position(j, p)
+        return -1
+
+    def find_all(self, y, start=0, stop=None):
+        return [self._global_position(j, p) for j, ps in enumerate(self._map('find_all', y, start, stop))
+                for p in ps]
+
+    def count(self, y):
+        return sum(self._map('count', y))
+
+    def doc_freq(self, y):
+        # each sequence being held by one shard, the counts of the shards add up
+        return sum(self._map('doc_freq', y))
+
+    def occurrences(self, y):
+        for p in self.find_all(y):
+            yield self.getSeqId(p)
+
+    def evaluatePerSequence(self, s, seqIdxs=None):
+        # each sequence being held by one shard, its covering is evaluated by this shard alone
+        if seqIdxs is None:
+            groups = {j: None for j in range(len(self.shards))}
+        else:
+            groups = self._by_shard(seqIdxs)
+        for j, ids in groups.items():
+            self.shards[j].send('evaluatePerSequence', s, ids)
+        scores = {}
+        for j, result in zip(groups, self._gather([self.shards[j] for j in groups])):
+            for i, score in result.items():
+                scores[self.global_ids[j][i]] = score
+        return scores
+
+    def _matchFreq(self, s, beg):
+        d = self._longestMatch(s, beg)
+        return d, self.doc_freq(s[beg:beg + d])
+
+    def _match_start(self):
+        return []
+
+    def _match_step(self, state, c):
+        # the state is the segment itself, looked up in the shards
+        segment = state + [c]
+        return segment if self.find(segment) >= 0 else None
+
+    def matchingStatistics(self, s, seqIdxs=None):
+        '''
+        :param s: a sequence
+        :param seqIdxs: Optional: List of indexes of sequences. If provided, only the subsequences common to all these
+        sequences are matched.
+        :return: the list ms of the matching statistics of s: the maximum over the shards of their matching statistics
+        (the minimum over the shards holding seqIdxs, if provided)
+        '''
+        if seqIdxs is None:
+            return [max(m) for m in zip(*self._map('matchingStatistics', s))] if len(s) else []
+        groups = self._by_shard(set(seqIdxs))
+        for j, ids in groups.items():
+            self.shards[j].send('matchingStatistics', s, ids)
+        mss = self._gather([self.shards[j] for j in groups])
+        return [min(m) for m in zip(*mss)] if mss and len(s) else [len(s) - i for i in range(len(s))]
+
+    def _longestMatch(self, s, beg):
+        return max(self._map('_longestMatch', s, beg))
+
+    def _sequence(self, i):
+        return self._call(self.shard_of[i], '_sequence', self.local_id[i])
+
+    def lcs(self, seqIdxs=-1):
+        """Returns the Largest Common Subsequence of sequences provided in seqIdxs.
+        If seqIdxs is not provided, the LCS of all sequences is returned.
+        Computed from the matching statistics of the shortest of these sequences, restricted in each shard to the
+        subsequences common to its part of seqIdxs.
+
+        ::param seqIdxs: Optional: List of indexes of sequences.
+        """
+        if seqIdxs == -1 or not isinstance(seqIdxs, list):
+            seqIdxs = list(range(len(self.word_starts)))
+        if len(seqIdxs) == 0:
+            return []
+        i = min(seqIdxs, key=lambda i: self.ends[i] - self.begs[i])
+        x = self._sequence(i)
+        ms = self.matchingStatistics(x, seqIdxs)
+        if not ms:
+            return []
+        p = max(range(len(ms)), key=lambda p: ms[p])
+        return x[p:p + ms[p]]
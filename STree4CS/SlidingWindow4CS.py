@@ -0,0 +1,62 @@
+'''
+Generalized suffix tree over a sliding window of the last sequences of a stream, updated online: new sequences are
+appended to the tree, old ones are lazily removed and the tree is compacted from time to time.
+'''
+from .STree4CS import STree4CS
+
+
+class SlidingWindow4CS():
+    """Class representing a generalized suffix tree over the last `size` sequences added."""
+
+    def __init__(self, size, compaction=0.5, nodeStore=False):
+        '''
+        :param size: number of sequences kept in the window
+        :param compaction: the tree is compacted when the removed sequences hold more than this fraction of its word
+        :param nodeStore: see STree4CS
+        '''
+        self.size = size
+        self.compaction = compaction
+        self.tree = STree4CS(nodeStore=nodeStore)
+        self.offset = 0  # id of the sequence of index 0 in the tree
+        self.oldest = 0  # index in the tree of the oldest sequence of the window
+        self.removedLength = 0
+
+    def __getattr__(self, name):
+        # queries (find, find_all, lcs, evaluate*, ...) are answered by the tree
+        if name == 'tree':
+            raise AttributeError(name)
+        return getattr(self.tree, name)
+
+    def __len__(self):
+        return len(self.tree.begs) - self.oldest
+
+    def add(self, x):
+        '''
+        Appends the sequence x to the window, retiring the oldest sequence if the window is full.
+
+        :param x: Sequence (list of integers)
+        :return: the id of x, i.e. its rank in the stream of added sequences
+        '''
+        id = self.offset + self.tree.add_sequence(x)
+        if len(self) > self.size:
+            t = self.tree
+            t.remove_sequence(self.oldest)
+            self.removedLength += t.ends[self.oldest] - t.begs[self.oldest] + 1
+            self.oldest += 1
+            if self.removedLength > self.compaction * len(t.word):
+                self.compact()
+        return id
+
+    def compact(self):
+        """Rebuilds the tree from the sequences of the window."""
+        self.tree.compact()
+        self.offset += self.oldest
+        self.oldest = 0
+        self.removedLength = 0
+
+    def seqId(self, i):
+        '''
+        :param i: index of a sequence in the tree, e.g. as returned by getSeqId
+        :return: the id of the sequence, i.e. its rank in the stream of added sequences
+        '''
+        return self.offset + i
@@ -0,0 +1,194 @@
+'''
+Opt-in instrumentation of an index: counters and timers of the calls of its hot-path methods, of the transition
+lookups and suffix links followed in its tree, and of the symbols of its text compared to the queries.
+
+Nothing is instrumented until STree4CS.enable_stats() is called: the counting versions of the methods are then
+installed on the index itself (and those of the nodes on their classes, while at least one index is instrumented),
+and removed by disable_stats(), so that a disabled index runs exactly the plain code.
+'''
+import time
+import numpy as np
+from functools import wraps
+
+from .STree4CS import _SNode, _SNodeRef
+
+# methods counted and timed, when the index has them
+METHODS = ('build', '_concatenate', '_build_McCreight', '_build_bulk', '_compute_slink', '_create_node', '_create_leaf',
+           '_ensure_labeled', '_label_generalized', '_ensure_counted', 'add_sequence', 'find', 'find_all', 'count',
+           'doc_freq', '_locate', '_descend', 'getNextBreakDichotomic', 'matchingStatistics', '_longestMatchNode',
+           '_interval', '_narrow', '_symbol', '_extend', '_position', 'lcs', '_ensure_mined')
+# evaluations, reported to the callback one call at a time
+EVALUATIONS = ('evaluateDichotomic', 'evaluateSimple', 'evaluateLinear', 'evaluateBounded', 'evaluateWeighted',
+               'evaluateArrays', 'evaluateThreshold', 'evaluateApprox', 'evaluatePerSequence')
+
+_active = []  # stats of the instrumented methods being executed, innermost last
+_patched = {}  # original methods of the node classes
+_enabled = [0]  # number of instrumented indexes
+
+
+def _add(counts, name, n=1):
+    counts[name] = counts.get(name, 0) + n
+
+
+def _get_transition_link(get):
+    def counted(node, suffix):
+        child = get(node, suffix)
+        if _active:
+            counts = _active[-1].counts
+            _add(counts, 'transition_lookups')
+            if child:
+                _add(counts, 'node_visits')
+        return child
+    return counted
+
+
+def _get_suffix_link(get):
+    def counted(node):
+        if _active:
+            _add(_active[-1].counts, 'suffix_links')
+        return get(node)
+    return counted
+
+
+def _patch_nodes():
+    if _enabled[0] == 0:
+        for cls in (_SNode, _SNodeRef):
+            _patched[cls] = (cls._get_transition_link, cls._get_suffix_link)
+            cls._get_transition_link = _get_transition_link(cls._get_transition_link)
+            cls._get_suffix_link = _get_suffix_link(cls._get_suffix_link)
+    _enabled[0] += 1
+
+
+def _unpatch_nodes():
+    _enabled[0] -= 1
+    if _enabled[0] == 0:
+        for cls, (get_transition, get_slink) in _patched.items():
+            cls._get_transition_link = get_transition
+            cls._get_suffix_link = get_slink
+        _patched.clear()
+
+
+class _CountedWord():
+    """View of the text of an index counting the symbols read one at a time, i.e. compared to a query or, while
+    building, to the text itself."""
+
+    def __init__(self, word, counts):
+        self.word = word
+        self.counts = counts
+
+    def __getitem__(self, i):
+        if not isinstance(i, slice):
+            _add(self.counts, 'symbols_compared')
+        return self.word[i]
+
+    def __len__(self):
+        return len(self.word)
+
+    def __iter__(self):
+        return iter(self.word)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.word, dtype=dtype)
+
+    def __getattr__(self, name):
+        if name == 'word':
+            raise AttributeError(name)
+        return getattr(self.word, name)
+
+
+class Stats4CS():
+    """Counters and timers of an instrumented index (see STree4CS.enable_stats)."""
+
+    def __init__(self, index, callback=None):
+        '''
+        :param index: the STree4CS (SArray4CS, Sharded4CS) index
+        :param callback: optional function called after each evaluation as callback(method, stats), stats being the
+        dict of the counts and times of this evaluation alone
+        '''
+        self.index = index
+        self.callback = callback
+        self.counts = {}  # name -> number of calls (methods) or of events (transition_lookups, ...)
+        self.times = {}  # method name -> seconds spent in the method, nested calls included
+        self._installed = []
+
+    def as_dict(self):
+        """Returns the counts and times as a dict {'counts': {...}, 'times': {...}}."""
+        return {'counts': dict(self.counts), 'times': dict(self.times)}
+
+    def plain_state(self, state):
+        """Returns a copy of the attributes state of the index without the instrumentation: the counting methods,
+        the stats themselves and the counting views of the text are left out or unwrapped."""
+        return {k: v.word if isinstance(v, _CountedWord) else v for k, v in state.items()
+                if k != 'stats' and k not in self._installed}
+
+    def reset(self):
+        self.counts.clear()
+        self.times.clear()
+
+    def install(self):
+        index = self.index
+        for name in METHODS + EVALUATIONS:
+            if hasattr(index, name):
+                setattr(index, name, self._wrap(name, getattr(index, name), name in EVALUATIONS))
+                self._installed.append(name)
+        if hasattr(index, 'root'):
+            _patch_nodes()
+        self._wrap_word()
+
+    def uninstall(self):
+        index = self.index
+        for name in self._installed:
+            delattr(index, name)
+        self._installed = []
+        if hasattr(index, 'root'):
+            _unpatch_nodes()
+        for attr in ('word', '_word'):
+            word = getattr(index, attr, None)
+            if isinstance(word, _CountedWord):
+                setattr(index, attr, word.word)
+
+    def _wrap_word(self):
+        # the text, and the view of it that the suffix array compares to the queries
+        for attr in ('word', '_word'):
+            word = getattr(self.index, attr, None)
+            if word is not None and not isinstance(word, _CountedWord):
+                setattr(self.index, attr, _CountedWord(word, self.counts))
+
+    def _wrap(self, name, method, evaluation):
+        counts = self.counts
+        times = self.times
+
+        @wraps(method)
+        def counted(*args, **kwargs):
+            if name == '_build_McCreight' and not isinstance(args[0], _CountedWord):
+                args = (_CountedWord(args[0], counts),) + args[1:]
+            if evaluation:
+                before = (dict(counts), dict(times))
+            _add(counts, name)
+            if name == '_extend':
+                # a backward search step of the FM-index matches one symbol of the query
+                _add(counts, 'symbols_compared')
+            _active.append(self)
+            t0 = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                _add(times, name, time.perf_counter() - t0)
+                _active.pop()
+            if name in ('build', 'add_sequence'):
+                self._wrap_word()  # the text has been replaced or extended
+            if evaluation and result is not None:
+                # [score, lbreak, lss], or the dict of arrays of evaluateArrays; the other evaluations do not return
+                # the segments
+                segments = result.get('starts') if isinstance(result, dict) else result[2] if len(result) == 3 else None
+                if segments is not None and not np.isscalar(segments):
+                    _add(counts, 'segments', len(segments))
+            if evaluation and self.callback is not None:
+                self.callback(name, {'counts': _delta(counts, before[0]), 'times': _delta(times, before[1])})
+            return result
+
+        return counted
+
+
+def _delta(now, before):
+    return {k: v - before.get(k, 0) for k, v in now.items() if v != before.get(k, 0)}
@@ -0,0 +1,103 @@
+'''
+Streaming covering evaluation: the covering of an unbounded stream of symbols by the subsequences of an index is
+computed online, each segment being output as soon as it is closed. The memory used is bounded by the current
+segment (and by the window, if a windowed score is requested), not by the length of the stream.
+'''
+from collections import deque
+
+
+class CoveringStream():
+    """Class representing the greedy covering of a stream of symbols, with the same segments as
+    STree4CS.evaluateLinear on the whole sequence."""
+
+    def __init__(self, index, symbols=None, window=None):
+        '''
+        :param index: the STree4CS (SArray4CS or Sharded4CS) index, which must not be modified while streaming
+        :param symbols: optional iterable of symbols, possibly unbounded, consumed lazily when iterating
+        :param window: optional number N of symbols of the windowed score, over the last N symbols
+        '''
+        self.index = index
+        self.symbols = symbols
+        self.window = window
+        self.n = 0  # number of symbols consumed
+        self.nSegments = 0  # number of segments, including the current one
+        self.segment = []  # symbols of the current segment
+        self._state = None  # match state of the current segment in the index, None if it is not found
+        self._starts = deque()  # starting positions of the segments overlapping the window
+
+    def __iter__(self):
+        '''
+        :return: generator of the (segment, lbreak) pairs of the closed segments, lbreak being the [symbol, length]
+        entry of evaluateDichotomic; the last segment, when symbols is exhausted, comes with lbreak None
+        '''
+        for c in self.symbols:
+            closed = self.push(c)
+            if closed is not None:
+                yield closed
+        last = self.close()
+        if last is not None:
+            yield last
+
+    def push(self, c):
+        '''
+        Appends the symbol c to the stream.
+
+        :return: the (segment, lbreak) pair of the segment closed by c, or None if c extends the current segment
+        '''
+        index = self.index
+        closed = None
+        if self.segment and self._state is not None:
+            state = index._match_step(self._state, c)
+            if state is not None:
+                self.segment.append(c)
+                self._state = state
+                self._advance(False)
+                return None
+        if self.segment:
+            closed = (self.segment, [c, len(self.segment)])
+        self.segment = [c]
+        self._state = index._match_step(index._match_start(), c)
+        self._advance(True)
+        return closed
+
+    def close(self):
+        '''
+        Ends the stream.
+
+        :return: the (segment, None) pair of the last segment, or None if the stream is empty
+        '''
+        if not self.segment:
+            return None
+        last = (self.segment, None)
+        self.segment = []
+        self._state = None
+        return last
+
+    def _advance(self, newSegment):
+        """Helper method that accounts for one more symbol, starting a new segment or not."""
+        if newSegment:
+            self.nSegments += 1
+            if self.window is not None:
+                self._starts.append(self.n)
+        self.n += 1
+        if self.window is not None:
+            first = self.n - min(self.window, self.n)
+            while len(self._starts) > 1 and self._starts[1] <= first:
+                self._starts.popleft()
+
+    @property
+    def score(self):
+        """Covering similarity of the symbols consumed so far, (L-len(lss)+1)/L as in evaluateDichotomic."""
+        if self.n == 0:
+            return 1
+        return (self.n - self.nSegments + 1) / self.n
+
+    @property
+    def windowScore(self):
+        """Covering similarity of the last N symbols, the segments being restricted to the window."""
+        if self.window is None:
+            raise ValueError("No window given to the stream")
+        W = min(self.window, self.n)
+        if W == 0:
+            return 1
+        return (W - len(self._starts) + 1) / W
@@ -0,0 +1,227 @@
+'''
+Reproducible benchmark suite: builds, queries and covering evaluations on synthetic corpora (random sequences
+generated as in testCoveringSimilarity.randomList, from a fixed seed) across alphabet sizes, corpus sizes and query
+lengths. Reports timings, throughputs, peak memory and node counts, and stores them as JSON baselines so that the
+regressions show up between versions:
+
+$ python3 -m STree4CS.benchmark4CS --out baseline.json
+$ python3 -m STree4CS.benchmark4CS --baseline baseline.json
+'''
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+
+from .STree4CS import STree4CS
+from .coveringSimilarity import covering_distance_matrix
+
+# (alphabet size, number of sequences, sequence length, query length)
+CASES = [(4, 20, 200, 50), (64, 20, 200, 50), (1024, 20, 200, 50), (4, 200, 200, 200), (64, 200, 200, 200)]
+QUICK_CASES = [(4, 10, 50, 20), (64, 10, 50, 20)]
+
+# results where lower is better; the others are throughputs, where higher is better
+LOWER_IS_BETTER = ('seconds', 'peak_bytes')
+
+
+def randomList(rng, rg, minl, maxl):
+    '''
+    :param rng: random.Random generator
+    :return: a list of random integers in [0, rg], of length uniform in [minl, maxl)
+    '''
+    l = int(rng.uniform(minl, maxl))
+    return [rng.randint(0, rg) for i in range(l)]
+
+
+def corpus(rg, n, length, seed=0):
+    """Returns n random sequences of integers in [0, rg), of lengths around length."""
+    rng = random.Random(seed)
+    return [randomList(rng, rg - 1, length // 2, 3 * length // 2) for i in range(n)]
+
+
+def queries(seqs, n, length, seed=1):
+    '''
+    :return: n queries of the given length, half of them made of pieces copied from seqs (so that the matches are
+    long), half of them random
+    '''
+    rng = random.Random(seed)
+    rg = max(max(x) for x in seqs if x)
+    out = []
+    for i in range(n):
+        if i % 2:
+            out.append(randomList(rng, rg, length, length + 1))
+            continue
+        q = []
+        while len(q) < length:
+            x = rng.choice(seqs)
+            b = rng.randint(0, max(len(x) - 1, 0))
+            q.extend(x[b:b + rng.randint(1, 20)])
+        out.append(q[:length])
+    return out
+
+
+def timeit(f, repeat=3):
+    """Returns the best of repeat wall-clock timings of f(), in seconds."""
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        f()
+        t = time.perf_counter() - t0
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def peak_memory(f):
+    """Returns the peak memory allocated by Python while running f(), in bytes."""
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def node_count(st):
+    """Returns the number of nodes of the suffix tree st."""
+    if st.nodeStore is not None:
+        return len(st.nodeStore)
+    n = [0]
+
+    def count(node):
+        n[0] += 1
+
+    st.root._traverse(count)
+    return n[0]
+
+
+def bench_case(rg, n, length, qlength, repeat=3, n_queries=50, n_jobs=2):
+    '''
+    :return: dict of the results of one case, name -> value
+    '''
+    seqs = corpus(rg, n, length)
+    qs = queries(seqs, n_queries, qlength)
+    size = sum(len(x) for x in seqs)
+    symbols = n_queries * qlength
+    r = {}
+
+    r['build.seconds'] = timeit(lambda: STree4CS(seqs), repeat)
+    r['build.symbols_per_second'] = size / r['build.seconds']
+    r['build.peak_bytes'] = peak_memory(lambda: STree4CS(seqs))
+    r['build_nodestore.seconds'] = timeit(lambda: STree4CS(seqs, nodeStore=True), repeat)
+    r['build_nodestore.peak_bytes'] = peak_memory(lambda: STree4CS(seqs, nodeStore=True))
+    r['build_bulk.seconds'] = timeit(lambda: STree4CS(seqs, bulk=True), repeat)
+    r['build_bulk.peak_bytes'] = peak_memory(lambda: STree4CS(seqs, bulk=True))
+    r['build_sa.seconds'] = timeit(lambda: STree4CS(seqs, backend='sa'), repeat)
+    r['build_sa.peak_bytes'] = peak_memory(lambda: STree4CS(seqs, backend='sa'))
+    r['build_fm.seconds'] = timeit(lambda: STree4CS(seqs, backend='fm'), repeat)
+
+    st = STree4CS(seqs)
+    r['nodes'] = node_count(st)
+    trees = [STree4CS(seqs) for i in range(repeat)]
+    r['label.seconds'] = min(timeit(t._ensure_labeled, 1) for t in trees)
+    st._ensure_labeled()
+
+    short = [q[:8] for q in qs]
+    r['find.queries_per_second'] = len(short) / timeit(lambda: [st.find(q) for q in short], repeat)
+    r['find_all.queries_per_second'] = len(short) / timeit(lambda: [st.find_all(q) for q in short], repeat)
+    r['count.queries_per_second'] = len(short) / timeit(lambda: [st.count(q) for q in short], repeat)
+    # lcs keeps what it mined: each tree (labeled above) is timed once
+    r['lcs.seconds'] = min(timeit(t.lcs, 1) for t in trees)
+
+    for method in ('evaluateSimple', 'evaluateDichotomic', 'evaluateLinear', 'evaluateBounded'):
+        evaluate = getattr(st, method)
+        r[method + '.symbols_per_second'] = symbols / timeit(lambda: [evaluate(q) for q in qs], repeat)
+
+    # locus cache (a new one at each timing), on the queries seen once and on the queries evaluated 3 times
+    cached = STree4CS(seqs)
+
+    def evaluate_cached(qs):
+        cached.enable_cache(100000)
+        return [cached.evaluateDichotomic(q) for q in qs]
+
+    r['evaluateDichotomic_cached.symbols_per_second'] = symbols / timeit(lambda: evaluate_cached(qs), repeat)
+    r['evaluateDichotomic_cached_repeated.symbols_per_second'] = 3 * symbols / timeit(
+        lambda: evaluate_cached(qs * 3), repeat)
+    sa = STree4CS(seqs, backend='sa')
+    r['evaluateLinear_sa.symbols_per_second'] = symbols / timeit(lambda: [sa.evaluateLinear(q) for q in qs], repeat)
+    fm = STree4CS(seqs, backend='fm')
+    r['evaluateLinear_fm.symbols_per_second'] = symbols / timeit(lambda: [fm.evaluateLinear(q) for q in qs], repeat)
+
+    r['evaluate_many.symbols_per_second'] = symbols / timeit(
+        lambda: list(st.evaluate_many(qs, method='linear', n_jobs=n_jobs, chunksize=8)), 1)
+    pairs = seqs[:20]
+    r['distance_matrix.pairs_per_second'] = len(pairs) * (len(pairs) - 1) / 2 / timeit(
+        lambda: covering_distance_matrix(pairs, n_jobs=n_jobs, block=8), 1)
+    return r
+
+
+def run(cases=CASES, repeat=3, n_jobs=2, verbose=True):
+    '''
+    :return: the results of all the cases, as a JSON-serializable dict
+    '''
+    results = {'python': platform.python_version(), 'machine': platform.machine(), 'cases': {}}
+    for case in cases:
+        name = 'alphabet=%d/n=%d/length=%d/query=%d' % case
+        if verbose:
+            print(name, end=' ', flush=True)
+        t0 = time.perf_counter()
+        results['cases'][name] = bench_case(*case, repeat=repeat, n_jobs=n_jobs)
+        if verbose:
+            print('%.1fs' % (time.perf_counter() - t0))
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    '''
+    :param tolerance: relative change below which a difference is ignored (timings are noisy)
+    :return: the list of (case, name, baseline value, value) of the results worse than the baseline
+    '''
+    regressions = []
+    for case, r in results['cases'].items():
+        b = baseline['cases'].get(case, {})
+        for name, value in r.items():
+            if name not in b or name == 'nodes' or not b[name]:
+                continue
+            if name.endswith(LOWER_IS_BETTER):
+                worse = value > b[name] * (1 + tolerance)
+            else:
+                worse = value < b[name] * (1 - tolerance)
+            if worse:
+                regressions.append((case, name, b[name], value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--quick', action='store_true', help='small cases, for a quick check')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timings of each measure, the best is kept')
+    parser.add_argument('--n_jobs', type=int, default=2, help='worker processes of the batch measures')
+    parser.add_argument('--out', help='JSON file where the results are saved, e.g. as a new baseline')
+    parser.add_argument('--baseline', help='JSON file of results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative change tolerated')
+    args = parser.parse_args(argv)
+
+    results = run(QUICK_CASES if args.quick else CASES, args.repeat, args.n_jobs)
+    for case, r in results['cases'].items():
+        print(case)
+        for name in sorted(r):
+            print('    %-40s %.6g' % (name, r[name]))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for case, name, b, value in regressions:
+            print('REGRESSION', case, name, 'baseline', '%.6g' % b, 'now', '%.6g' % value)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+'''
+Covering similarity and distance between sets of sequences, each sequence (or class of sequences) being indexed once
+by its own suffix tree.
+'''
+import heapq
+import numpy as np
+
+from .STree4CS import STree4CS, _EVALUATORS, _chunks
+from .parallel import imap_shared
+
+
+def _tiles(N, block):
+    """Helper generator of the (rows, columns) ranges of the upper triangle of a NxN matrix, in blocks."""
+    for i0 in range(0, N, block):
+        for j0 in range(i0, N, block):
+            yield (i0, min(i0 + block, N)), (j0, min(j0 + block, N))
+
+
+def _distance_tile(shared, tile):
+    trees, seqs, method = shared
+    (i0, i1), (j0, j1) = tile
+    out = []
+    for i in range(i0, i1):
+        evaluate_i = getattr(trees[i], method)
+        for j in range(max(j0, i + 1), j1):
+            s_ij = getattr(trees[j], method)(seqs[i])[0]
+            s_ji = evaluate_i(seqs[j])[0]
+            out.append((i, j, 1.0 - (s_ij + s_ji) / 2.0))
+    return out
+
+
+def covering_distance_matrix(seqs, n_jobs=1, condensed=False, block=64, method='linear'):
+    '''
+    Pairwise covering distance d(s1, s2) = 1 - (c(s1|s2) + c(s2|s1))/2, c(s1|s2) being the covering similarity of s1
+    evaluated on the suffix tree of s2 (see coveringDistance in testCoveringSimilarity.py).
+
+    :param seqs: list of sequences (lists of integers)
+    :param n_jobs: number of worker processes (see parallel.imap_shared), None or -1 for all the cores
+    :param condensed: if True, returns only the upper triangle as a condensed vector, in the order used by
+    scipy.spatial.distance.squareform, instead of the NxN matrix
+    :param block: size of the square tiles of the matrix sent to the worker processes
+    :param method: covering evaluation used, 'linear' (default), 'dichotomic' or 'simple'
+    :return: the NxN NumPy distance matrix, or its condensed vector of length N(N-1)/2
+    '''
+    N = len(seqs)
+    trees = [STree4CS([list(s)]) for s in seqs]
+    shared = (trees, seqs, _EVALUATORS[method])
+    if condensed:
+        D = np.zeros(N * (N - 1) // 2)
+    else:
+        D = np.zeros((N, N))
+    for tile in imap_shared(shared, _distance_tile, _tiles(N, block), n_jobs):
+        for i, j, d in tile:
+            if condensed:
+                D[N * i - i * (i + 1) // 2 + j - i - 1] = d
+            else:
+                D[i, j] = D[j, i] = d
+    return D
+
+
+class CoveringClassifier():
+    """Nearest-class retrieval by covering similarity, the sequences of each class being indexed by one generalized
+    suffix tree."""
+
+    def __init__(self, classes=None):
+        '''
+        :param classes: optional dict label -> list of sequences (or already built STree4CS) of the class
+        '''
+        self.labels = []
+        self.trees = []
+        if classes is not None:
+            for label, sequences in classes.items():
+                self.add(label, sequences)
+
+    def add(self, label, sequences):
+        '''
+        :param label: label of the class
+        :param sequences: list of sequences of the class, or an STree4CS (or SArray4CS) index built on them
+        '''
+        if not isinstance(sequences, STree4CS):
+            sequences = STree4CS([list(x) for x in sequences])
+        self.labels.append(label)
+        self.trees.append(sequences)
+
+    def topk(self, s, k=1, threshold=None, approx=None):
+        '''
+        :param s: the query sequence
+        :param k: number of classes returned, at least 1
+        :param threshold: optional minimum covering similarity of the classes returned
+        :param approx: optional (epsilon, confidence) or (epsilon, confidence, seed): the classes are ranked by the
+        approximate covering similarity of s (see STree4CS.evaluateApprox), for long queries
+        :return: the list of the k (label, covering similarity) pairs with the highest covering similarity of s, by
+        decreasing similarity. The evaluation of a class stops as soon as its score cannot reach the current k-th best
+        (or threshold), so that a query far from all the classes is rejected after a few segments per class.
+        '''
+        if k < 1:
+            raise ValueError("k should be at least 1")
+        best = []  # min-heap of (score, -class index)
+        for i, tree in enumerate(self.trees):
+            if approx is not None:
+                score = tree.evaluateApprox(s, *approx)[0]
+                if threshold is not None and score < threshold:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (score, -i))
+                else:
+                    heapq.heappushpop(best, (score, -i))
+                continue
+            minScore = best[0][0] if len(best) == k else None
+            if threshold is not None and (minScore is None or minScore < threshold):
+                minScore = threshold
+            r = tree.evaluateBounded(s, minScore)
+            if r is None:
+                continue
+            if len(best) < k:
+                heapq.heappush(best, (r[0], -i))
+            else:
+                heapq.heappushpop(best, (r[0], -i))
+        return [(self.labels[-i], score) for score, i in sorted(best, reverse=True)]
+
+    def predict(self, s):
+        '''
+        :return: the label of the class with the highest covering similarity of s
+        '''
+        return self.topk(s, 1)[0][0]
+
+    def screen(self, s, threshold, approx=None):
+        '''
+        :param s: the query sequence
+        :param threshold: the covering similarity to be reached
+        :param approx: optional (epsilon, confidence) or (epsilon, confidence, seed): the classes are screened on the
+        approximate covering similarity of s (see STree4CS.evaluateApprox) instead
+        :return: the list of the labels of the classes whose covering similarity of s is at least threshold, each
+        class being evaluated only until the decision is certain (see STree4CS.evaluateThreshold)
+        '''
+        if approx is not None:
+            return [label for label, tree in zip(self.labels, self.trees)
+                    if tree.evaluateApprox(s, *approx)[0] >= threshold]
+        return [label for label, tree in zip(self.labels, self.trees) if tree.evaluateThreshold(s, threshold)[0]]
+
+    def topk_many(self, queries, k=1, n_jobs=1, chunksize=64, threshold=None, approx=None):
+        '''
+        :param queries: iterable of query sequences, consumed lazily
+        :param n_jobs: number of worker processes sharing the trees (see parallel.imap_shared), None or -1 for all
+        the cores
+        :return: generator of the topk(s, k, threshold, approx) results, in the order of the queries
+        '''
+        if k < 1:
+            raise ValueError("k should be at least 1")
+        tasks = _chunks(queries, (k, threshold, approx), chunksize)
+        return (r for chunk in imap_shared(self, _topk_chunk, tasks, n_jobs) for r in chunk)
+
+    def screen_many(self, queries, threshold, n_jobs=1, chunksize=64, approx=None):
+        '''
+        :param queries: iterable of query sequences, consumed lazily
+        :param n_jobs: number of worker processes sharing the trees (see parallel.imap_shared), None or -1 for all
+        the cores
+        :return: generator of the screen(s, threshold, approx) results, in the order of the queries
+        '''
+        tasks = _chunks(queries, (threshold, approx), chunksize)
+        return (r for chunk in imap_shared(self, _screen_chunk, tasks, n_jobs) for r in chunk)
+
+
+def _topk_chunk(classifier, task):
+    (k, threshold, approx), chunk = task
+    return [classifier.topk(s, k, threshold, approx) for s in chunk]
+
+
+def _screen_chunk(classifier, task):
+    (threshold, approx), chunk = task
+    return [classifier.screen(s, threshold, approx) for s in chunk]
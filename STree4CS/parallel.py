@@ -0,0 +1,67 @@
+'''
+Helpers running tasks in worker processes that share one read-only object, typically a built or loaded index.
+'''
+import os
+import multiprocessing
+from collections import deque
+
+_shared = None
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def _call(func, task):
+    return func(_shared, task)
+
+
+def n_workers(n_jobs):
+    '''
+    :param n_jobs: number of worker processes, None or a negative value for all the cores
+    :return: the actual number of worker processes
+    '''
+    if n_jobs is None or n_jobs < 0:
+        return os.cpu_count() or 1
+    return max(1, n_jobs)
+
+
+def imap_shared(shared, func, tasks, n_jobs=None, max_pending=None):
+    '''
+    :param shared: object made available to every worker process. With the 'fork' start method it is inherited by
+    the workers without any pickling, otherwise it is pickled once per worker (a memory-mapped index loaded with
+    STree4CS.load is pickled as its path, a built tree as the flat arrays of its nodes)
+    :param func: module-level function called as func(shared, task) in the workers
+    :param tasks: iterable of tasks, consumed lazily
+    :param n_jobs: number of worker processes, None or -1 for all the cores; with 1 the tasks run in the calling process
+    :param max_pending: maximum number of tasks in flight (default 2 per worker), which bounds the memory used
+    :return: generator of the func(shared, task) results, in the order of the tasks
+    '''
+    global _shared
+    n = n_workers(n_jobs)
+    if n == 1:
+        for task in tasks:
+            yield func(shared, task)
+        return
+    if max_pending is None:
+        max_pending = 2 * n
+    if 'fork' in multiprocessing.get_all_start_methods():
+        previous = _shared
+        _shared = shared
+        try:
+            pool = multiprocessing.get_context('fork').Pool(n)
+        finally:
+            _shared = previous
+    else:
+        pool = multiprocessing.Pool(n, initializer=_init_worker, initargs=(shared,))
+    try:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(_call, (func, task)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
@@ -1,6 +1,13 @@
 from STree4CS import STree4CS as STree
+from STree4CS.coveringSimilarity import covering_distance_matrix, CoveringClassifier
 import random
+import asyncio
+import pickle
+import tempfile
 import numpy as np
+from STree4CS.Sharded4CS import Sharded4CS
+from STree4CS.FMIndex4CS import FMIndex4CS
+from STree4CS.Server4CS import CoveringService
 
 
 def randomList(rg, minl, maxl):
@@ -116,7 +123,563 @@ def test3():
           coveringDistance_str('narcotics', 'narcoleptics'))
     print('covering distance  between \'burns out\' and \'outburns\' is ', coveringDistance_str('burns out', 'outburns'))
 
+
+def test4():
+    '''
+    test the covering distance matrix against the pairwise coveringDistance
+    :return:
+    '''
+    seqs = [randomList(3, 10, 20) for n in range(20)]
+    D = covering_distance_matrix(seqs, n_jobs=2, block=8)
+    for i in range(len(seqs)):
+        for j in range(len(seqs)):
+            if abs(D[i, j] - coveringDistance(seqs[i], seqs[j])) > 1e-12:
+                print('covering distance matrix differs at', i, j)
+                return
+    print('covering distance matrix matches coveringDistance')
+
+
+def test5():
+    '''
+    test that evaluateLinear returns the same covering as evaluateDichotomic, on the suffix tree (built by McCreight's
+    algorithm or in bulk), the suffix array and the FM-index
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(3, 0, 20) for i in range(random.randint(1, 5))]
+        s = randomList(5, 0, 30)
+        ref = STree.STree4CS(S).evaluateDichotomic(s)
+        for kwargs in ({}, {'bulk': True}, {'nodeStore': True}, {'backend': 'sa'}, {'backend': 'fm'}):
+            st = STree.STree4CS(S, **kwargs)
+            if st.evaluateLinear(s) != ref or st.evaluateDichotomic(s) != ref:
+                print('coverings differ for', kwargs, S, s)
+                return
+        print('.', end='', flush=True)
+    print('evaluateLinear matches evaluateDichotomic on every backend')
+
+
+def test6():
+    '''
+    test that the coverings of a tree updated with add_sequence and remove_sequence are those of a tree built from
+    scratch on the remaining sequences, and that find finds the same subsequences on both
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(3, 0, 20) for i in range(random.randint(1, 4))]
+        added = [randomList(3, 0, 20) for i in range(random.randint(1, 3))]
+        s = randomList(4, 0, 30)
+        for nodeStore in (False, True):
+            st = STree.STree4CS(S, nodeStore=nodeStore)
+            for x in added:
+                st.add_sequence(x)
+            removed = random.randrange(len(S) + len(added))
+            st.remove_sequence(removed)
+            ref = STree.STree4CS([x for i, x in enumerate(S + added) if i != removed])
+            if st.evaluateLinear(s) != ref.evaluateLinear(s) or st.evaluateDichotomic(s) != ref.evaluateDichotomic(s):
+                print('updated tree differs from the rebuilt one', S, added, removed, s)
+                return
+            if (st.find(s[:3]) == -1) != (ref.find(s[:3]) == -1):
+                print('find differs on the updated tree', S, added, removed, s)
+                return
+        print('.', end='', flush=True)
+    print('updated trees match the rebuilt ones')
+
+
+def test7():
+    '''
+    test that a tree saved and loaded back, after some sequences were removed, evaluates as before saving
+    :return:
+    '''
+    for n in range(20):
+        S = [randomList(3, 1, 20) for i in range(random.randint(2, 5))]
+        s = randomList(4, 0, 30)
+        for nodeStore in (False, True):
+            st = STree.STree4CS(S, nodeStore=nodeStore)
+            st.remove_sequence(random.randrange(len(S)))
+            ref = st.evaluateLinear(s)
+            for mmap in (True, False):
+                path = tempfile.mkdtemp()
+                st.save(path)
+                if STree.STree4CS.load(path, mmap=mmap).evaluateLinear(s) != ref:
+                    print('loaded tree differs from the saved one', S, st.removed, s)
+                    return
+        print('.', end='', flush=True)
+    print('loaded trees match the saved ones')
+
     
+def test8():
+    '''
+    test that a sharded index held by worker processes evaluates as a single tree, also after a query failed in the
+    shards
+    :return:
+    '''
+    for n in range(10):
+        S = [randomList(3, 1, 20) for i in range(random.randint(2, 6))]
+        s = randomList(4, 0, 30)
+        ref = STree.STree4CS(S)
+        with Sharded4CS(S, n_shards=random.randint(2, 3), processes=True) as sh:
+            for bad in (None, [{}]):
+                try:
+                    sh.find(bad)
+                except TypeError:
+                    pass
+                if sh.evaluateDichotomic(s) != ref.evaluateDichotomic(s) or sh.count(s[:2]) != ref.count(s[:2]):
+                    print('sharded index differs from the single tree', S, s)
+                    return
+        print('.', end='', flush=True)
+    print('sharded indexes match the single trees')
+
+
+def test9():
+    '''
+    test that the stats of every backend count the symbols compared, and that an instrumented index is pickled as a
+    plain one
+    :return:
+    '''
+    for n in range(20):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 4))]
+        s = randomList(4, 1, 30)
+        for kwargs in ({}, {'nodeStore': True}, {'backend': 'sa'}, {'backend': 'fm'}):
+            st = STree.STree4CS(S, **kwargs)
+            ref = st.evaluateDichotomic(s)
+            evaluations = []
+            stats = st.enable_stats(callback=lambda method, d: evaluations.append(method))
+            st.evaluateDichotomic(s)
+            st.evaluateThreshold(s, 0.5)
+            copy = pickle.loads(pickle.dumps(st))
+            # the trees may only look up transitions, the arrays compare symbols
+            compared = stats.counts.get('symbols_compared', 0) + stats.counts.get('transition_lookups', 0)
+            if compared == 0 or evaluations != ['evaluateDichotomic', 'evaluateThreshold']:
+                print('stats not counted', kwargs, S, s, stats.counts, evaluations)
+                return
+            if copy.stats is not None or copy.evaluateDichotomic(s) != ref:
+                print('pickled instrumented index differs', kwargs, S, s)
+                return
+        print('.', end='', flush=True)
+    print('stats are counted on every backend')
+
+
+def test10():
+    '''
+    test that the classes returned by CoveringClassifier.topk have the k best covering similarities, and that k must
+    be at least 1
+    :return:
+    '''
+    for n in range(50):
+        classes = {c: [randomList(3, 1, 20) for i in range(random.randint(1, 3))] for c in range(random.randint(1, 5))}
+        s = randomList(3, 1, 30)
+        k = random.randint(1, 4)
+        classifier = CoveringClassifier(classes)
+        scores = sorted((STree.STree4CS(x).evaluateDichotomic(s)[0] for x in classes.values()), reverse=True)
+        if [score for label, score in classifier.topk(s, k)] != scores[:k]:
+            print('topk differs from the best coverings', classes, s, k)
+            return
+        try:
+            classifier.topk(s, 0)
+            print('topk accepted k=0')
+            return
+        except ValueError:
+            pass
+        print('.', end='', flush=True)
+    print('topk returns the best classes')
+
+
+def test11():
+    '''
+    test that the suffix array backend finds the same occurrences and matching statistics as the suffix tree
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 4))]
+        s = randomList(4, 1, 30)
+        st = STree.STree4CS(S)
+        sa = STree.STree4CS(S, backend='sa')
+        y = s[:3]
+        if sorted(sa.find_all(y)) != sorted(st.find_all(y)) or sa.count(y) != st.count(y) or \
+                sa.matchingStatistics(s) != st.matchingStatistics(s) or len(sa.lcs()) != len(st.lcs()):
+            print('suffix array differs from the suffix tree', S, s)
+            return
+        print('.', end='', flush=True)
+    print('suffix arrays match the suffix trees')
+
+
+def test12():
+    '''
+    test that the indexes of every backend, saved and memory-mapped back, evaluate and count as before saving
+    :return:
+    '''
+    for n in range(20):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 4))]
+        s = randomList(4, 1, 30)
+        for kwargs in ({}, {'nodeStore': True}, {'backend': 'sa'}, {'backend': 'fm'}):
+            st = STree.STree4CS(S, **kwargs)
+            path = tempfile.mkdtemp()
+            st.save(path)
+            loaded = STree.STree4CS.load(path)
+            if loaded.evaluateLinear(s) != st.evaluateLinear(s) or loaded.count(s[:2]) != st.count(s[:2]):
+                print('loaded index differs from the saved one', kwargs, S, s)
+                return
+        print('.', end='', flush=True)
+    print('loaded indexes match the saved ones')
+
+
+def test13():
+    '''
+    test that evaluate_many, in the calling process or in worker processes, returns the evaluations of the queries in
+    their order
+    :return:
+    '''
+    for n in range(5):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 4))]
+        queries = [randomList(4, 1, 30) for i in range(50)]
+        st = STree.STree4CS(S)
+        ref = [st.evaluateDichotomic(s) for s in queries]
+        for n_jobs in (1, 2):
+            if list(st.evaluate_many(iter(queries), n_jobs=n_jobs, chunksize=7)) != ref:
+                print('evaluate_many differs from evaluateDichotomic', n_jobs, S)
+                return
+        print('.', end='', flush=True)
+    print('evaluate_many matches the evaluations one by one')
+
+
+def longestCommonSubstring(S):
+    '''
+    brute force longest common substring of the sequences of S
+    '''
+    x = min(S, key=len)
+    for length in range(len(x), 0, -1):
+        for i in range(len(x) - length + 1):
+            y = x[i:i + length]
+            if all(any(z[j:j + length] == y for j in range(len(z) - length + 1)) for z in S):
+                return x[i:i + length]
+    return []
+
+
+def test14():
+    '''
+    test lcs against a brute force search, on the labels of the nodes, and on long repetitive sequences that are
+    traversed without recursion
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(2, 1, 20) for i in range(random.randint(2, 4))]
+        if len(STree.STree4CS(S).lcs()) != len(longestCommonSubstring(S)):
+            print('lcs differs from the brute force one', S)
+            return
+        print('.', end='', flush=True)
+    S = [[0] * 5000, [0] * 3000 + [1]]
+    if len(STree.STree4CS(S).lcs()) != 3000:
+        print('lcs of the repetitive sequences should have length 3000')
+        return
+    print('lcs matches the brute force one')
+
+
+def test15():
+    '''
+    test that find and find_all match y[start:stop] in place as they match the copy of the subsequence
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 4))]
+        s = randomList(3, 1, 30)
+        start = random.randint(0, len(s))
+        stop = random.randint(start, len(s) + 2)
+        for kwargs in ({}, {'backend': 'sa'}, {'backend': 'fm'}):
+            st = STree.STree4CS(S, **kwargs)
+            if st.find(s, start, stop) != st.find(s[start:stop]) or \
+                    st.find_all(s, start, stop) != st.find_all(s[start:stop]):
+                print('find differs on the subsequence', kwargs, S, s, start, stop)
+                return
+        print('.', end='', flush=True)
+    print('find matches the subsequences in place')
+
+
+def test16():
+    '''
+    test that an index built from NumPy arrays, or from a flat array and its boundaries, evaluates as the one built
+    from lists, the symbols being encoded as dense codes
+    :return:
+    '''
+    for n in range(100):
+        S = [[10 * x - 7 for x in randomList(3, 1, 20)] for i in range(random.randint(1, 4))]
+        s = [10 * x - 7 for x in randomList(4, 1, 30)]
+        st = STree.STree4CS(S)
+        offsets = np.cumsum([0] + [len(x) for x in S])
+        for other in (STree.STree4CS([np.array(x) for x in S]), STree.STree4CS.from_flat(np.concatenate(S), offsets)):
+            # the segments of a NumPy query are slices of it: the scores and breaks are compared
+            if other.evaluateDichotomic(np.array(s))[:2] != st.evaluateDichotomic(s)[:2] or \
+                    sorted(other.codebook) != sorted(set(x for y in S for x in y)):
+                print('index built from NumPy arrays differs', S, s)
+                return
+        print('.', end='', flush=True)
+    print('indexes built from NumPy arrays match the ones built from lists')
+
+
+def test17():
+    '''
+    test that the covering of a stream of symbols is the covering of the whole sequence
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 4))]
+        s = randomList(4, 1, 30)
+        ref = STree.STree4CS(S).evaluateDichotomic(s)
+        for kwargs in ({}, {'backend': 'sa'}, {'backend': 'fm'}):
+            stream = STree.STree4CS(S, **kwargs).evaluateStream(iter(s), window=10)
+            segments = [segment for segment, lbreak in stream]
+            if [list(x) for x in segments] != ref[2] or stream.score != ref[0]:
+                print('covering of the stream differs', kwargs, S, s)
+                return
+        print('.', end='', flush=True)
+    print('coverings of the streams match the ones of the sequences')
+
+
+def test18():
+    '''
+    test count, doc_freq and occurrences against a brute force search of the sequences, also after a sequence was
+    removed
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(2, 1, 20) for i in range(random.randint(2, 4))]
+        y = randomList(2, 1, 3)
+        st = STree.STree4CS(S)
+        removed = random.randrange(len(S))
+        for update in (False, True):
+            if update:
+                st.remove_sequence(removed)
+            found = [(i, j) for i, x in enumerate(S) for j in range(len(x) - len(y) + 1)
+                     if x[j:j + len(y)] == y and not (update and i == removed)]
+            if st.count(y) != len(found) or st.doc_freq(y) != len(set(i for i, j in found)) or \
+                    sorted(st.occurrences(y)) != found:
+                print('occurrences differ from the brute force ones', S, y, update)
+                return
+        print('.', end='', flush=True)
+    print('occurrence counts match the brute force ones')
+
+
+def test19():
+    '''
+    test that the trees with a locus cache evaluate and find as without it, on repeated and overlapping queries and
+    after an update of the tree
+    :return:
+    '''
+    for n in range(50):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 4))]
+        queries = [randomList(4, 1, 30) for i in range(5)]
+        queries += [s[1:] for s in queries]
+        ref = STree.STree4CS(S)
+        st = STree.STree4CS(S, nodeStore=random.random() < 0.5)
+        st.enable_cache(maxsize=random.choice([1, 10, 1000]))
+        for update in (False, True):
+            if update:
+                x = randomList(3, 1, 20)
+                ref.add_sequence(x)
+                st.add_sequence(x)
+            for s in queries * 2:
+                if st.evaluateDichotomic(s) != ref.evaluateDichotomic(s) or st.find(s[:4]) != ref.find(s[:4]):
+                    print('cached tree differs from the plain one', S, s, update)
+                    return
+        if st.cache_info()['hits'] == 0:
+            print('the cache was never hit', S)
+            return
+        print('.', end='', flush=True)
+    print('cached trees match the plain ones')
+
+
+def test20():
+    '''
+    test that evaluatePerSequence scores each sequence as a tree built on this sequence alone, and that topk ranks the
+    sequences by these scores
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 5))]
+        s = randomList(3, 1, 30)
+        for kwargs in ({}, {'backend': 'sa'}):
+            st = STree.STree4CS(S, **kwargs)
+            scores = st.evaluatePerSequence(s)
+            if scores != {i: STree.STree4CS([x]).evaluateDichotomic(s)[0] for i, x in enumerate(S)}:
+                print('evaluatePerSequence differs from the trees of the sequences', kwargs, S, s)
+                return
+            k = random.randint(1, len(S))
+            if st.topk(s, k) != sorted(scores.items(), key=lambda p: (-p[1], p[0]))[:k]:
+                print('topk differs from the ranked scores', kwargs, S, s, k)
+                return
+        print('.', end='', flush=True)
+    print('per sequence scores match the trees of the sequences')
+
+
+def test21():
+    '''
+    test that evaluateThreshold decides as the exact score, within its bounds, and that the score of evaluateApprox is
+    within its halfwidth of the exact one, on short queries (exact) and on long ones (sampled)
+    :return:
+    '''
+    for n in range(20):
+        S = [randomList(3, 1, 200) for i in range(random.randint(1, 4))]
+        st = STree.STree4CS(S)
+        for s in (randomList(3, 1, 30), randomList(3, 1500, 2000)):
+            score = st.evaluateDichotomic(s)[0]
+            threshold = random.random()
+            passed, lo, hi = st.evaluateThreshold(s, threshold)
+            if passed != (score >= threshold) or not lo <= score <= hi:
+                print('evaluateThreshold differs from the exact score', S, s, threshold)
+                return
+            approx, halfwidth = st.evaluateApprox(s, epsilon=0.3, confidence=0.999, seed=n)
+            if abs(approx - score) > halfwidth + 1e-9:
+                print('evaluateApprox is not within its halfwidth of the exact score', S, s)
+                return
+        print('.', end='', flush=True)
+    print('threshold and approximate evaluations match the exact scores')
+
+
+def test22():
+    '''
+    test that the trees built in bulk from the suffix and LCP arrays have the nodes of the trees built by McCreight's
+    algorithm, and find and evaluate as them, also once updated
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 4))]
+        s = randomList(4, 1, 30)
+        x = randomList(3, 1, 20)
+        refs = (STree.STree4CS(S), STree.STree4CS(S + [x]))
+        for bulk in (STree.STree4CS(S, bulk=True), STree.STree4CS(S, nodeStore=True)):
+            for st in refs:
+                if st is refs[1]:
+                    bulk.add_sequence(x)
+                if len(bulk._index_arrays()['idx']) != len(st._index_arrays()['idx']) or \
+                        bulk.find(s[:3]) != st.find(s[:3]) or bulk.evaluateDichotomic(s) != st.evaluateDichotomic(s):
+                    print('tree built in bulk differs', S, x, s)
+                    return
+        print('.', end='', flush=True)
+    print('trees built in bulk match the ones built by McCreight\'s algorithm')
+
+
+def test23():
+    '''
+    test that the concurrent requests of the scoring service, batched and evaluated by a thread or by worker processes,
+    return the evaluations of their queries
+    :return:
+    '''
+    async def evaluate(st, queries, n_jobs):
+        async with CoveringService(st, n_jobs=n_jobs) as service:
+            results = await asyncio.gather(*[service.evaluate(s) for s in queries],
+                                           service.evaluate(queries[0], method='threshold', threshold=0.5))
+            return results, service.metrics()
+
+    for n in range(5):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 4))]
+        queries = [randomList(4, 1, 30) for i in range(20)]
+        st = STree.STree4CS(S)
+        for n_jobs in (1, 2):
+            results, metrics = asyncio.run(evaluate(st, queries, n_jobs))
+            if results[:-1] != [st.evaluateDichotomic(s) for s in queries] or \
+                    results[-1] != st.evaluateThreshold(queries[0], 0.5) or metrics['completed'] != len(results):
+                print('scoring service differs from the evaluations', n_jobs, S)
+                return
+        print('.', end='', flush=True)
+    print('scoring service matches the evaluations')
+
+
+def test24():
+    '''
+    test that the FM-index finds the same occurrences and evaluates as the suffix tree, whatever its sampling rate, and
+    once pickled
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 4))]
+        s = randomList(4, 1, 30)
+        y = s[:3]
+        st = STree.STree4CS(S)
+        fm = FMIndex4CS(S, sampleRate=random.choice([1, 4, 32]))
+        for index in (fm, pickle.loads(pickle.dumps(fm))):
+            if sorted(index.find_all(y)) != sorted(st.find_all(y)) or index.doc_freq(y) != st.doc_freq(y) or \
+                    sorted(index.occurrences(y)) != sorted(st.occurrences(y)) or \
+                    index.evaluateLinear(s) != st.evaluateLinear(s):
+                print('FM-index differs from the suffix tree', S, s)
+                return
+        print('.', end='', flush=True)
+    print('FM-indexes match the suffix trees')
+
+
+def substringOccurrences(S):
+    '''
+    brute force occurrences of the substrings of the sequences of S: substring -> list of (sequence index, offset)
+    '''
+    occ = {}
+    for i, x in enumerate(S):
+        for j in range(len(x)):
+            for k in range(j + 1, len(x) + 1):
+                occ.setdefault(tuple(x[j:k]), []).append((i, j))
+    return occ
+
+
+def test25():
+    '''
+    test maximal_repeats, common_substrings and lcs_many against a brute force search of the substrings
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(2, 1, 12) for i in range(random.randint(2, 4))]
+        st = STree.STree4CS(S)
+        occ = substringOccurrences(S)
+        # the start and the end of a sequence are distinct from any symbol and from those of the other sequences
+        repeats = set((y, len(o)) for y, o in occ.items() if len(o) >= 2 and
+                      len(set(S[i][j - 1] if j else (-1, i) for i, j in o)) > 1 and
+                      len(set(S[i][j + len(y)] if j + len(y) < len(S[i]) else (-2, i) for i, j in o)) > 1)
+        if set((tuple(y), c) for y, c in st.maximal_repeats()) != repeats:
+            print('maximal_repeats differs from the brute force ones', S)
+            return
+        m = random.randint(2, len(S))
+        support = {y: len(set(i for i, j in o)) for y, o in occ.items()}
+        common = set((y, support[y]) for y in occ if support[y] >= m and
+                     not any(support.get(y + (c,), 0) >= m for c in range(3)))
+        if set((tuple(y), c) for y, c in st.common_substrings(m)) != common:
+            print('common_substrings differs from the brute force ones', S, m)
+            return
+        subsets = [random.sample(range(len(S)), random.randint(1, len(S))) for i in range(3)]
+        if [len(x) for x in st.lcs_many(subsets)] != [len(longestCommonSubstring([S[i] for i in subset]))
+                                                     for subset in subsets]:
+            print('lcs_many differs from the brute force ones', S, subsets)
+            return
+        print('.', end='', flush=True)
+    print('mined substrings match the brute force ones')
+
+
+def test26():
+    '''
+    test that evaluateArrays returns the covering of evaluateLinear, and that each occurrence it maps to a sequence
+    holds its segment
+    :return:
+    '''
+    for n in range(100):
+        S = [randomList(3, 1, 20) for i in range(random.randint(1, 4))]
+        s = randomList(4, 1, 30)
+        for kwargs in ({}, {'backend': 'sa'}, {'backend': 'fm'}):
+            st = STree.STree4CS(S, **kwargs)
+            score, lbreak, lss = st.evaluateLinear(s)
+            for occurrences in ('first', 'all'):
+                cov = st.evaluateArrays(s, occurrences=occurrences)
+                segments = [s[b:e] for b, e in zip(cov['starts'], cov['ends'])]
+                if cov['score'] != score or segments != lss or list(cov['ms']) != st.matchingStatistics(s):
+                    print('evaluateArrays differs from evaluateLinear', kwargs, S, s)
+                    return
+                index = cov['segment'] if occurrences == 'all' else range(len(segments))
+                for k, i, j in zip(index, cov['seq'], cov['offset']):
+                    y = segments[k]
+                    if i >= 0 and S[i][j:j + len(y)] != y or i < 0 and y[0] in sum(S, []):
+                        print('occurrence of evaluateArrays does not hold its segment', kwargs, S, s, y, i, j)
+                        return
+                if occurrences == 'all' and len(cov['seq']) != sum(st.count(y) for y in segments):
+                    print('evaluateArrays misses occurrences', kwargs, S, s)
+                    return
+        print('.', end='', flush=True)
+    print('array coverings match evaluateLinear')
+
+
 def test_plagiarism():
     # Example from https://www.princeton.edu/pr/pub/integrity/pages/plagiarism/
     # Text example 2. Lifting selected passages and phrases without proper acknowledgment 
@@ -127,8 +690,8 @@ def test_plagiarism():
     sref="From time to time this submerged or latent theater in Hamlet becomes almost overt. It is close to the surface in Hamlet’s pretense of madness, the “antic disposition” he puts on to protect himself and prevent his antagonists from plucking out the heart of his mystery. It is even closer to the surface when Hamlet enters his mother’s room and holds up, side by side, the pictures of the two kings, Old Hamlet and Claudius, and proceeds to describe for her the true nature of the choice she has made, presenting truth by means of a show. Similarly, when he leaps into the open grave at Ophelia’s funeral, ranting in high heroic terms, he is acting out for Laertes, and perhaps for himself as well, the folly of excessive, melodramatic expressions of grief."
     s1i=str2intarray(s1)
     srefi=str2intarray(sref)
-    st1 = STree.STree([s1i])
-    stref = STree.STree([srefi])
+    st1 = STree.STree4CS([s1i])
+    stref = STree.STree4CS([srefi])
     c1 = stref.evaluateDichotomic(s1i)
     cref = st1.evaluateDichotomic(srefi)
     d = 1.0/2.0*(2-c1[0]-cref[0])